@@ -0,0 +1 @@
+# Empty file to make the directory a Python package 
@@ -0,0 +1,109 @@
+"""
+Measure recall@k against query latency for each vector index type.
+
+Ground truth comes from an exact IndexFlatL2 scan over the same vectors. Each
+approximate index is swept over its query-time knob (nprobe for IVF types,
+efSearch for HNSW) so a deployment can pick the cheapest setting that meets
+its recall target.
+
+By default the corpus is synthetic: clustered Gaussian vectors with the same
+dimension as all-MiniLM-L6-v2. Pass --documents with a JSON list of documents
+(title/content/tags, like BATTERY_KNOWLEDGE_DATA) to embed a real corpus instead.
+
+Usage:
+    python -m backend.benchmarks.ann_recall --vectors 100000 --queries 1000 --k 10
+"""
+import argparse
+import json
+import time
+import numpy as np
+from backend.database.nosql.ann_index import INDEX_TYPES, build_index, set_search_params, default_nlist
+
+DIMENSION = 384
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128]
+
+
+def synthetic_vectors(n: int, dimension: int, clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Clustered data; uniform noise has no structure for an ANN index to exploit."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype("float32")
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dimension)).astype("float32")
+
+
+def embed_documents(path: str) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+    with open(path) as f:
+        documents = json.load(f)
+    texts = [f"{doc['title']}\n{doc['content']}\n{' '.join(doc['tags'])}" for doc in documents]
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    return np.asarray(model.encode(texts, batch_size=64), dtype="float32")
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Search one query at a time, the way the API does, and report per-query latency."""
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, indices = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = indices[0]
+    latencies = np.array(latencies) * 1000
+    return found, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument("--documents", help="JSON file of documents to embed instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="comma-separated index types")
+    args = parser.parse_args()
+
+    if args.documents:
+        corpus = embed_documents(args.documents)
+    else:
+        corpus = synthetic_vectors(args.vectors, DIMENSION)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors, so every query has genuine near neighbours
+    queries = corpus[rng.integers(0, len(corpus), size=args.queries)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype("float32")
+    k = min(args.k, len(corpus))
+
+    exact = build_index(corpus, "flat")
+    truth, _, _ = timed_search(exact, queries, k)
+
+    print(f"corpus={len(corpus):,} dim={corpus.shape[1]} queries={len(queries):,} k={k} nlist={default_nlist(len(corpus))}")
+    print(f"{'index':>9} {'param':>14} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for index_type in args.types.split(","):
+        started = time.perf_counter()
+        index = build_index(corpus, index_type)
+        build_seconds = time.perf_counter() - started
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            sweep = [("nprobe", value) for value in NPROBE_SWEEP]
+        elif index_type == "hnsw":
+            sweep = [("efSearch", value) for value in EF_SEARCH_SWEEP]
+        else:
+            sweep = [("-", None)]
+
+        for name, value in sweep:
+            if name == "nprobe":
+                set_search_params(index, nprobe=value)
+            elif name == "efSearch":
+                set_search_params(index, ef_search=value)
+            found, p50, p99 = timed_search(index, queries, k)
+            param = "-" if value is None else f"{name}={value}"
+            print(f"{index_type:>9} {param:>14} {build_seconds:>8.2f} {recall_at_k(found, truth):>9.3f} {p50:>8.3f} {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare the cost of shipping SQL results to the frontend in each format.
+
+Formats:
+  repr    - str(list_of_rows) on the backend, eval() on the client (the old behaviour)
+  json    - typed column-oriented JSON, rebuilt into a DataFrame on the client
+  arrow   - Arrow IPC stream, read straight into a DataFrame
+
+Usage:
+    python -m backend.benchmarks.result_serialization --rows 10000,1000000
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import time
+import pandas as pd
+from backend.database.sql.result_format import to_columnar, to_arrow_ipc, arrow_available
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Same shape as a SELECT * FROM telemetry.
+COLUMNS = ["id", "battery_id", "timestamp", "energy_in", "energy_out"]
+
+
+def make_rows(n: int) -> list:
+    start = datetime(2023, 10, 11)
+    return [
+        (i, i % 50, start + timedelta(minutes=i), 40.0 + (i % 97) * 0.5, 20.0 + (i % 89) * 0.25)
+        for i in range(n)
+    ]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - started
+
+
+def bench_repr(rows):
+    payload, encode = timed(lambda: json.dumps({"result": str(rows)}))
+    _, decode = timed(lambda: pd.DataFrame(eval(json.loads(payload)["result"], {"datetime": __import__("datetime")})))
+    return len(payload), encode, decode
+
+
+def bench_json(rows):
+    def encode():
+        result = to_columnar(COLUMNS, rows)
+        return json.dumps({"result": result.model_dump(mode="json")})
+
+    payload, encode_seconds = timed(encode)
+
+    def decode():
+        result = json.loads(payload)["result"]
+        df = pd.DataFrame({c["name"]: v for c, v in zip(result["columns"], result["values"])})
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        return df
+
+    _, decode_seconds = timed(decode)
+    return len(payload), encode_seconds, decode_seconds
+
+
+def bench_arrow(rows):
+    payload, encode = timed(lambda: to_arrow_ipc(to_columnar(COLUMNS, rows)))
+    _, decode = timed(lambda: pa.ipc.open_stream(payload).read_pandas())
+    return len(payload), encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,1000000", help="comma-separated row counts")
+    parser.add_argument("--skip-repr", action="store_true", help="skip the slow repr/eval baseline")
+    args = parser.parse_args()
+
+    formats = [("json", bench_json)]
+    if not args.skip_repr:
+        formats.insert(0, ("repr", bench_repr))
+    if arrow_available():
+        formats.append(("arrow", bench_arrow))
+
+    print(f"{'rows':>9} {'format':>6} {'bytes':>12} {'encode s':>9} {'decode s':>9}")
+    for n in [int(value) for value in args.rows.split(",")]:
+        rows = make_rows(n)
+        for name, bench in formats:
+            size, encode, decode = bench(rows)
+            print(f"{n:>9} {name:>6} {size:>12,} {encode:>9.3f} {decode:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
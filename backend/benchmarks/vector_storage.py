@@ -0,0 +1,62 @@
+"""
+Measure memory footprint and recall for each vector storage mode.
+
+For every mode (float32, fp16, sq8, pq) the index is built over the same corpus and
+reported with:
+  bytes/vec   - bytes the index stores per vector
+  index MB    - size of the serialized index, including graph links and id maps
+  recall      - recall@k of the index on its own
+  rescored    - recall@k after fetching k * --rescore-factor candidates and re-ranking
+                them exactly against the float32 embeddings, as VectorSearch does
+
+Usage:
+    python -m backend.benchmarks.vector_storage --vectors 200000 --type hnsw
+"""
+import argparse
+import faiss
+import numpy as np
+from backend.database.nosql.ann_index import INDEX_TYPES, STORAGE_MODES, build_index, exact_rerank, vector_code_size
+from backend.benchmarks.ann_recall import DIMENSION, synthetic_vectors, embed_documents, recall_at_k, timed_search
+
+
+def rescored_search(index, corpus: np.ndarray, queries: np.ndarray, k: int, factor: int) -> np.ndarray:
+    found = np.full((len(queries), k), -1, dtype="int64")
+    _, candidates = index.search(queries, k * factor)
+    for i, (query, row) in enumerate(zip(queries, candidates)):
+        row = row[row >= 0]
+        _, ids = exact_rerank(query, row, corpus[row], k)
+        found[i, :len(ids)] = ids
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument("--documents", help="JSON file of documents to embed instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--type", default="flat", choices=INDEX_TYPES, help="index type to pair with each storage mode")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = embed_documents(args.documents) if args.documents else synthetic_vectors(args.vectors, DIMENSION)
+    rng = np.random.default_rng(1)
+    queries = corpus[rng.integers(0, len(corpus), size=args.queries)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype("float32")
+    k = min(args.k, len(corpus))
+
+    truth, _, _ = timed_search(build_index(corpus, "flat"), queries, k)
+
+    print(f"corpus={len(corpus):,} dim={corpus.shape[1]} queries={len(queries):,} k={k} type={args.type}")
+    print(f"{'storage':>8} {'bytes/vec':>9} {'index MB':>9} {'recall':>7} {'rescored':>8} {'p50 ms':>7}")
+    for storage in STORAGE_MODES:
+        index = build_index(corpus, args.type, storage=storage)
+        index_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        found, p50, _ = timed_search(index, queries, k)
+        rescored = rescored_search(index, corpus, queries, k, args.rescore_factor)
+        print(f"{storage:>8} {vector_code_size(index):>9} {index_mb:>9.1f} "
+              f"{recall_at_k(found, truth):>7.3f} {recall_at_k(rescored, truth):>8.3f} {p50:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+from typing import Optional, Tuple
+import faiss
+import numpy as np
+import math
+import os
+
+# flat | ivf_flat | ivf_pq | hnsw | auto
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto").lower()
+# Below this many vectors an exact scan is both fast and perfectly accurate
+VECTOR_INDEX_FLAT_MAX = int(os.getenv("VECTOR_INDEX_FLAT_MAX", "10000"))
+# Above this many vectors HNSW graphs get too large to hold in memory; compress with IVF-PQ
+VECTOR_INDEX_HNSW_MAX = int(os.getenv("VECTOR_INDEX_HNSW_MAX", "1000000"))
+VECTOR_INDEX_TRAIN_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", "100000"))
+# 0 picks roughly 4 * sqrt(n) lists
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", "16"))
+VECTOR_INDEX_PQ_NBITS = int(os.getenv("VECTOR_INDEX_PQ_NBITS", "8"))
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+VECTOR_INDEX_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_EF_CONSTRUCTION", "200"))
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+
+# How vectors are stored inside the index: float32 | fp16 | sq8 (int8 scalar quantizer) | pq
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32").lower()
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+STORAGE_MODES = ("float32", "fp16", "sq8", "pq")
+
+_SCALAR_QUANTIZERS = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# k-means wants about this many training points per centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def choose_index_type(n_vectors: int, index_type: str = VECTOR_INDEX_TYPE) -> str:
+    """Resolve "auto" to a concrete index type for a corpus of this size."""
+    if index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type: {index_type}")
+        return index_type
+    if n_vectors <= VECTOR_INDEX_FLAT_MAX:
+        return "flat"
+    if n_vectors <= VECTOR_INDEX_HNSW_MAX:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def default_nlist(n_vectors: int) -> int:
+    nlist = VECTOR_INDEX_NLIST or int(4 * math.sqrt(n_vectors))
+    # Never ask k-means for more centroids than the data can support
+    return max(1, min(nlist, n_vectors // _MIN_POINTS_PER_CENTROID))
+
+
+def _pq_m(dimension: int, requested: int) -> int:
+    """Largest sub-quantizer count <= requested that divides the dimension."""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def training_sample(embeddings: np.ndarray, sample_size: int = VECTOR_INDEX_TRAIN_SAMPLE) -> np.ndarray:
+    """Train on a fixed-seed random subset; k-means quality saturates long before the full corpus."""
+    if len(embeddings) <= sample_size:
+        return embeddings
+    rows = np.random.default_rng(0).choice(len(embeddings), sample_size, replace=False)
+    return embeddings[np.sort(rows)]
+
+
+def build_index(embeddings: np.ndarray, index_type: str = VECTOR_INDEX_TYPE,
+                ids: Optional[np.ndarray] = None, storage: str = VECTOR_STORAGE, **params) -> faiss.Index:
+    """
+    Build and fill a FAISS index over L2 distance.
+
+    Args:
+        embeddings: float32 matrix, one row per document
+        index_type: flat, ivf_flat, ivf_pq, hnsw or auto
+        ids: int64 id per row; when given the index is wrapped in an IndexIDMap2
+            so vectors can later be added under ids of the caller's choosing
+        storage: float32, fp16, sq8 or pq; how vectors are encoded inside the index
+            (ivf_pq always stores product-quantized codes)
+        **params: overrides for nlist, nprobe, pq_m, pq_nbits, hnsw_m, ef_construction, ef_search
+
+    Returns:
+        faiss.Index: the populated index, with search parameters applied
+    """
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector storage mode: {storage}")
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n_vectors, dimension = embeddings.shape
+    index_type = choose_index_type(n_vectors, index_type)
+
+    pq_m = _pq_m(dimension, params.get("pq_m", VECTOR_INDEX_PQ_M))
+    # Each sub-quantizer has 2**nbits centroids, which also need training points
+    sample = min(n_vectors, VECTOR_INDEX_TRAIN_SAMPLE)
+    pq_nbits = min(params.get("pq_nbits", VECTOR_INDEX_PQ_NBITS), max(1, int(math.log2(sample))))
+
+    if index_type == "flat":
+        if storage == "float32":
+            index = faiss.IndexFlatL2(dimension)
+        elif storage == "pq":
+            # A single inverted list scans every code like IndexPQ, but honours search-time id selectors
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, 1, pq_m, pq_nbits)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, _SCALAR_QUANTIZERS[storage])
+    elif index_type == "hnsw":
+        hnsw_m = params.get("hnsw_m", VECTOR_INDEX_HNSW_M)
+        if storage == "float32":
+            index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        elif storage == "pq":
+            index = faiss.IndexHNSWPQ(dimension, pq_m, hnsw_m, pq_nbits)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, _SCALAR_QUANTIZERS[storage], hnsw_m)
+        index.hnsw.efConstruction = params.get("ef_construction", VECTOR_INDEX_EF_CONSTRUCTION)
+    else:
+        nlist = params.get("nlist") or default_nlist(n_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_pq" or storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+        elif storage == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, _SCALAR_QUANTIZERS[storage])
+
+    if not index.is_trained:
+        index.train(training_sample(embeddings))
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype="int64"))
+    else:
+        index.add(embeddings)
+    set_search_params(index, nprobe=params.get("nprobe"), ef_search=params.get("ef_search"))
+    return index
+
+
+def exact_rerank(query: np.ndarray, ids: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Order candidates by exact L2 distance to the query.
+
+    Args:
+        query: float32 query vector
+        ids: candidate ids
+        vectors: float32 vectors, vectors[i] belonging to ids[i]
+        k: how many to keep
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (distances, ids) of the k nearest candidates, nearest first
+    """
+    distances = ((vectors - query.reshape(1, -1)) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return distances[order], ids[order]
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    """Unwrap ID maps and similar wrappers to reach the index that owns the search parameters."""
+    index = faiss.downcast_index(index)
+    while hasattr(index, "index") and isinstance(getattr(index, "index"), faiss.Index):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None) -> None:
+    """Apply query-time recall/latency knobs; ignored by index types that don't have them."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe or VECTOR_INDEX_NPROBE, base.nlist)
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search or VECTOR_INDEX_EF_SEARCH
+
+
+def supports_selection(index: faiss.Index) -> bool:
+    """False for IndexPQ, which flat PQ indexes saved by earlier versions use and which rejects id selectors."""
+    return not isinstance(_base_index(index), faiss.IndexPQ)
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Per-query parameters restricting a search to the ids `selector` accepts, keeping the index's own knobs."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def vector_code_size(index: faiss.Index) -> int:
+    """Bytes the index stores per vector, excluding graph links and id maps."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    return int(base.sa_code_size())
+
+
+def describe_index(index: faiss.Index) -> dict:
+    base = _base_index(index)
+    code_size = vector_code_size(index)
+    info = {
+        "type": type(base).__name__,
+        "vectors": int(index.ntotal),
+        "dimension": int(index.d),
+        "bytes_per_vector": code_size,
+        "vector_bytes": code_size * int(index.ntotal),
+    }
+    if isinstance(base, faiss.IndexIVF):
+        info.update(nlist=int(base.nlist), nprobe=int(base.nprobe))
+    elif isinstance(base, faiss.IndexHNSW):
+        info.update(ef_search=int(base.hnsw.efSearch))
+    return info
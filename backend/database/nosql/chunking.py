@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import os
+from backend.database.nosql.document_store import DocumentView
+
+# MiniLM reads at most 256 word pieces (roughly 1000 characters); passages stay well inside that
+PASSAGE_CHARS = int(os.getenv("PASSAGE_CHARS", "600"))
+PASSAGE_OVERLAP = int(os.getenv("PASSAGE_OVERLAP", "120"))
+# At most this many of a document's passages are returned for it
+PASSAGES_PER_DOCUMENT = int(os.getenv("PASSAGES_PER_DOCUMENT", "2"))
+
+SPAN_SEPARATOR = "\n...\n"
+
+
+def _break_before(text: str, lo: int, hi: int) -> int:
+    """Where to end a passage in text[lo:hi]: after a sentence if possible, else between words."""
+    sentence = text.rfind(". ", lo, hi)
+    if sentence != -1:
+        return sentence + 1
+    space = text.rfind(" ", lo, hi)
+    return space if space != -1 else hi
+
+
+def split_passages(text: str, size: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    Cut text into overlapping (start, end) character spans of at most `size` characters.
+
+    Passages end at a sentence or word boundary in their second half, and each one starts
+    about `overlap` characters before the previous one ended, at the beginning of a word.
+    """
+    if len(text) <= size:
+        return [(0, len(text))]
+    # Every passage must move past the start of the one before it
+    overlap = min(overlap, size // 2 - 1)
+    spans = []
+    start = 0
+    while True:
+        end = min(start + size, len(text))
+        if end < len(text):
+            end = _break_before(text, start + size // 2, end)
+        spans.append((start, end))
+        if end >= len(text):
+            return spans
+        next_start = end - overlap
+        if next_start > 0 and not text[next_start - 1].isspace():
+            space = text.find(" ", next_start, end)
+            if space != -1:
+                next_start = space + 1
+        start = next_start
+
+
+def chunk_document(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a knowledge document into passages.
+
+    Each passage carries the parent's fields (so document_key and the metadata filters see
+    the parent), its own slice of the content, its number within the parent and the
+    (start, end) character offsets of that slice.
+    """
+    content = doc["content"]
+    return [
+        {**doc, "content": content[start:end], "passage": number, "start": start, "end": end}
+        for number, (start, end) in enumerate(split_passages(content))
+    ]
+
+
+class DocumentSpans:
+    """
+    A document as retrieval returns it: the parent's fields, with content cut down to the
+    passages that matched.
+
+    Passages that follow each other in the parent are merged into one span, overlap removed;
+    separate spans are joined with SPAN_SEPARATOR. `spans` holds their character offsets in
+    the full document.
+    """
+    __slots__ = ("_parent", "spans", "content", "relevance_score")
+
+    def __init__(self, passages: List[DocumentView], relevance_score: Optional[float] = None):
+        ordered = sorted(passages, key=lambda passage: passage.passage)
+        self._parent = ordered[0]
+        self.relevance_score = relevance_score
+        spans: List[Tuple[int, int]] = []
+        texts: List[str] = []
+        previous = None
+        for passage in ordered:
+            if previous is not None and passage.passage == previous + 1:
+                overlap = max(spans[-1][1] - passage.start, 0)
+                texts[-1] += passage.content[overlap:]
+                spans[-1] = (spans[-1][0], passage.end)
+            else:
+                texts.append(passage.content)
+                spans.append((passage.start, passage.end))
+            previous = passage.passage
+        self.spans = spans
+        self.content = SPAN_SEPARATOR.join(texts)
+
+    def with_score(self, relevance_score: float) -> "DocumentSpans":
+        scored = copy.copy(self)
+        scored.relevance_score = relevance_score
+        return scored
+
+    def keys(self) -> List[str]:
+        keys = ["_id", "title", "content", "category", "tags", "source", "spans"]
+        return keys if self.relevance_score is None else [*keys, "relevance_score"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "content":
+            return self.content
+        if key == "spans":
+            return self.spans
+        if key == "relevance_score" and self.relevance_score is not None:
+            return self.relevance_score
+        if key in ("_id", "title", "category", "tags", "source"):
+            return self._parent[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self.keys()}
@@ -0,0 +1,241 @@
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+FIELDS = ("_id", "title", "content", "category", "tags", "source", "passage", "start", "end")
+
+
+class DocumentView:
+    """
+    A read-only view of one stored document, optionally carrying a search score.
+
+    Supports item access (doc["title"], doc.get("_id")) like the dicts it replaces, so
+    callers need not care which they hold. Fields are read from the store on access.
+    """
+    __slots__ = ("_store", "_row", "relevance_score")
+
+    def __init__(self, store: "DocumentStore", row: int, relevance_score: Optional[float] = None):
+        self._store = store
+        self._row = row
+        self.relevance_score = relevance_score
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def title(self) -> str:
+        return self._store._titles[self._row]
+
+    @property
+    def content(self) -> str:
+        return self._store._content_at(self._row)
+
+    @property
+    def category(self) -> str:
+        return self._store._categories.values[self._store._category_codes[self._row]]
+
+    @property
+    def tags(self) -> List[str]:
+        return self._store._tags_at(self._row)
+
+    @property
+    def source(self) -> Optional[str]:
+        return self._store._sources[self._row]
+
+    @property
+    def passage(self) -> int:
+        """Which passage of its parent document this row holds (see chunking.chunk_document)."""
+        return self._store._passages[self._row]
+
+    @property
+    def start(self) -> int:
+        return self._store._passage_starts[self._row]
+
+    @property
+    def end(self) -> int:
+        return self._store._passage_ends[self._row]
+
+    def with_score(self, relevance_score: float) -> "DocumentView":
+        return DocumentView(self._store, self._row, relevance_score)
+
+    def keys(self) -> List[str]:
+        return list(FIELDS) if self.relevance_score is None else [*FIELDS, "relevance_score"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "_id":
+            return self._store._ids[self._row]
+        if key == "relevance_score" and self.relevance_score is not None:
+            return self.relevance_score
+        if key in FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self.keys()}
+
+
+class _Vocabulary:
+    """Interns repeated strings (categories, tags) as small integer codes."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class DocumentStore:
+    """
+    Column-oriented, append-only storage for knowledge documents (or their passages), addressed by row.
+
+    Rows line up with the vector index ids. All content lives in one UTF-8 buffer indexed
+    by offset arrays. Categories and tags are interned codes in typed arrays. Other fields
+    are one list per column rather than one dict per document. Replacing a document
+    appends its new content (unchanged content and tags are kept in place) and deleting
+    one only clears its live flag; dead_bytes counts what no live row points at any more,
+    and take() builds a compacted copy.
+    """
+
+    def __init__(self):
+        self._ids: List[Any] = []
+        self._titles: List[str] = []
+        self._sources: List[Optional[str]] = []
+        self._categories = _Vocabulary()
+        self._category_codes = array("i")
+        self._tags = _Vocabulary()
+        self._tag_codes = array("i")
+        self._tag_starts = array("q")
+        self._tag_ends = array("q")
+        self._content = bytearray()
+        self._content_starts = array("q")
+        self._content_ends = array("q")
+        # Position of each row's content within its parent document
+        self._passages = array("i")
+        self._passage_starts = array("q")
+        self._passage_ends = array("q")
+        self._live = bytearray()
+        self.live_count = 0
+        # Content and tag-code bytes left behind by replaced and deleted rows
+        self.dead_bytes = 0
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Any]) -> "DocumentStore":
+        store = cls()
+        store.extend(documents)
+        return store
+
+    def __len__(self) -> int:
+        """Number of rows, including deleted ones."""
+        return len(self._titles)
+
+    def __iter__(self) -> Iterator[DocumentView]:
+        """Live documents in row order."""
+        for row in range(len(self)):
+            if self._live[row]:
+                yield DocumentView(self, row)
+
+    def __getitem__(self, row: int) -> Optional[DocumentView]:
+        """The document at a row, or None if it was deleted."""
+        return DocumentView(self, row) if self._live[row] else None
+
+    def __setitem__(self, row: int, doc: Optional[Any]) -> None:
+        """Replace the document at a row; None deletes it."""
+        if doc is None:
+            self.delete(row)
+            return
+        self._write(row, doc)
+
+    def append(self, doc: Any) -> int:
+        row = len(self)
+        self._ids.append(None)
+        self._titles.append("")
+        self._sources.append(None)
+        self._category_codes.append(0)
+        self._tag_starts.append(0)
+        self._tag_ends.append(0)
+        self._content_starts.append(0)
+        self._content_ends.append(0)
+        self._passages.append(0)
+        self._passage_starts.append(0)
+        self._passage_ends.append(0)
+        self._live.append(0)
+        self._write(row, doc)
+        return row
+
+    def extend(self, documents: Iterable[Any]) -> None:
+        for doc in documents:
+            self.append(doc)
+
+    def delete(self, row: int) -> None:
+        if self._live[row]:
+            self._live[row] = 0
+            self.live_count -= 1
+            self.dead_bytes += self._content_ends[row] - self._content_starts[row]
+            self.dead_bytes += (self._tag_ends[row] - self._tag_starts[row]) * self._tag_codes.itemsize
+
+    def take(self, rows: Iterable[int]) -> "DocumentStore":
+        """A new store holding just these rows, renumbered from 0, with no dead content."""
+        return DocumentStore.from_documents(DocumentView(self, int(row)) for row in rows)
+
+    def _write(self, row: int, doc: Any) -> None:
+        self._ids[row] = doc.get("_id")
+        self._titles[row] = doc["title"]
+        self._sources[row] = doc.get("source")
+        self._category_codes[row] = self._categories.code(doc["category"])
+        # A live row being replaced keeps whatever did not change and leaves the rest dead
+        replacing = self._live[row]
+
+        codes = array("i", (self._tags.code(tag) for tag in doc["tags"]))
+        tag_start, tag_end = self._tag_starts[row], self._tag_ends[row]
+        if not replacing or self._tag_codes[tag_start:tag_end] != codes:
+            if replacing:
+                self.dead_bytes += (tag_end - tag_start) * self._tag_codes.itemsize
+            self._tag_starts[row] = len(self._tag_codes)
+            self._tag_codes.extend(codes)
+            self._tag_ends[row] = len(self._tag_codes)
+
+        encoded = doc["content"].encode("utf-8")
+        content_start, content_end = self._content_starts[row], self._content_ends[row]
+        if not replacing or self._content[content_start:content_end] != encoded:
+            if replacing:
+                self.dead_bytes += content_end - content_start
+            self._content_starts[row] = len(self._content)
+            self._content += encoded
+            self._content_ends[row] = len(self._content)
+
+        # A document stored whole is its own only passage
+        self._passages[row] = doc.get("passage", 0)
+        self._passage_starts[row] = doc.get("start", 0)
+        self._passage_ends[row] = doc.get("end", len(doc["content"]))
+
+        if not self._live[row]:
+            self._live[row] = 1
+            self.live_count += 1
+
+    def _content_at(self, row: int) -> str:
+        return self._content[self._content_starts[row]:self._content_ends[row]].decode("utf-8")
+
+    def _tags_at(self, row: int) -> List[str]:
+        values = self._tags.values
+        return [values[code] for code in self._tag_codes[self._tag_starts[row]:self._tag_ends[row]]]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rows": len(self),
+            "live": self.live_count,
+            "content_bytes": len(self._content),
+            "dead_bytes": self.dead_bytes,
+            "categories": len(self._categories.values),
+            "tags": len(self._tags.values),
+        }
@@ -0,0 +1,123 @@
+from concurrent.futures import Future
+from typing import List, Tuple
+import numpy as np
+import threading
+import asyncio
+import queue
+import time
+import os
+
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingService:
+    """
+    Micro-batching front end for a SentenceTransformer.
+
+    Concurrent callers submit texts; a single worker thread gathers whatever
+    arrives within EMBED_MAX_WAIT_MS (up to EMBED_MAX_BATCH_SIZE texts), runs one
+    vectorized encode() for the whole batch and hands each caller its rows.
+    """
+
+    def __init__(self, model, max_batch_size: int = EMBED_MAX_BATCH_SIZE, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[List[str], Future, float]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.total_queue_wait = 0.0
+        self.total_encode_seconds = 0.0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for the next batch; the future resolves to a float32 matrix."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Blocking encode through the batcher."""
+        return self.submit(texts).result()
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """Encode without blocking the event loop or holding an executor thread."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect(self) -> List[Tuple[List[str], Future, float]]:
+        batch = [self._queue.get()]
+        count = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # Claiming each future also drops those whose caller cancelled while queued
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._encode_batch(batch)
+            except Exception as e:
+                # Fail this batch's callers, but keep the worker alive for the next one
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _encode_batch(self, batch: List[Tuple[List[str], Future, float]]) -> None:
+        texts = [text for item_texts, _, _ in batch for text in item_texts]
+        started = time.perf_counter()
+        embeddings = np.asarray(
+            self.model.encode(texts, batch_size=self.max_batch_size),
+            dtype="float32",
+        )
+        encode_seconds = time.perf_counter() - started
+
+        offset = 0
+        for item_texts, future, _ in batch:
+            future.set_result(embeddings[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+            self.total_queue_wait += sum(started - submitted for _, _, submitted in batch)
+            self.total_encode_seconds += encode_seconds
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_queue_wait_ms": self.total_queue_wait / self.requests * 1000 if self.requests else 0.0,
+                "texts_per_second": self.texts / self.total_encode_seconds if self.total_encode_seconds else 0.0,
+            }
@@ -0,0 +1,116 @@
+from pymongo.errors import PyMongoError
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+from backend.executors import run_encoder
+from backend.database.nosql.vector_search import VectorSearch
+from backend.database.nosql.index_store import document_key
+from backend.database.nosql.knowledge_sync import KNOWLEDGE_PROJECTION
+
+# How many hits each retriever contributes to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# The usual RRF constant; larger values flatten the advantage of top ranks
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+
+def metadata_filter(category: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Mongo filter with the same meaning as VectorSearch's category/tags pre-filter."""
+    query: Dict[str, Any] = {}
+    if category:
+        query["category"] = category
+    if tags:
+        query["tags"] = {"$all": list(tags)}
+    return query
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int,
+                           rrf_k: int = HYBRID_RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal rank: score(d) = sum of 1 / (rrf_k + rank).
+
+    Only ranks are used, so BM25-style text scores and vector distances never have to be
+    put on a common scale. relevance_score is normalized so that a document ranked first
+    by every retriever scores 1.0.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+
+    best_possible = len(rankings) / (rrf_k + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [_with_score(docs[key], scores[key] / best_possible) for key in ordered]
+
+
+def _with_score(doc, relevance_score: float):
+    # Vector hits are passage views; documents found only by text search are Mongo dicts
+    if not isinstance(doc, dict):
+        return doc.with_score(relevance_score)
+    return dict(doc, relevance_score=relevance_score)
+
+
+class HybridRetriever:
+    """Lexical ($text) and dense (FAISS) retrieval run concurrently and fused by rank."""
+
+    def __init__(self, vector_search: VectorSearch, collection=None, candidates: int = HYBRID_CANDIDATES):
+        self.vector_search = vector_search
+        # Without a collection (bundled data, MongoDB down) this is plain vector search
+        self.collection = collection
+        self.candidates = candidates
+
+    async def text_search(self, query: str, limit: int, category: Optional[str] = None,
+                          tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Rank documents with the collection's text index."""
+        try:
+            cursor = self.collection.find(
+                {"$text": {"$search": query}, **metadata_filter(category, tags)},
+                {**KNOWLEDGE_PROJECTION, "score": {"$meta": "textScore"}},
+            ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+            return await cursor.to_list(length=limit)
+        except PyMongoError as e:
+            print(f"Warning: text search failed, using vector results only: {str(e)}")
+            return []
+
+    async def search(self, query: str, k: int = 3, category: Optional[str] = None,
+                     tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return the k best documents, restricted to a category and to documents carrying all tags."""
+        if self.collection is None:
+            return await self.vector_search.asearch(query, k=k, category=category, tags=tags)
+
+        vector_hits, text_hits = await asyncio.gather(
+            self.vector_search.asearch(query, k=self.candidates, category=category, tags=tags),
+            self.text_search(query, self.candidates, category, tags),
+        )
+        return await self._passages_only(query, reciprocal_rank_fusion([vector_hits, text_hits], k))
+
+    async def search_batch(self, queries: List[str], k: int = 3, category: Optional[str] = None,
+                           tags: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """search() for many queries, with one batched vector search covering all of them."""
+        if self.collection is None:
+            return await self.vector_search.asearch_batch(queries, k=k, category=category, tags=tags)
+
+        vector_hits, *text_hits = await asyncio.gather(
+            self.vector_search.asearch_batch(queries, k=self.candidates, category=category, tags=tags),
+            *(self.text_search(query, self.candidates, category, tags) for query in queries),
+        )
+        return list(await asyncio.gather(*(
+            self._passages_only(query, reciprocal_rank_fusion([vector, text], k))
+            for query, vector, text in zip(queries, vector_hits, text_hits)
+        )))
+
+    async def _passages_only(self, query: str, fused: List[Any]) -> List[Any]:
+        """Cut documents that only text search found down to their best passages, like the vector hits."""
+        keys = [document_key(doc) for doc in fused if isinstance(doc, dict)]
+        if not keys:
+            return fused
+        # Already cached by the vector search that just ran
+        query_embedding = await self.vector_search.aencode_query(query)
+        spans = await run_encoder(self.vector_search.document_spans, query_embedding, keys)
+        return [
+            spans[document_key(doc)].with_score(doc["relevance_score"])
+            if isinstance(doc, dict) and document_key(doc) in spans else doc
+            for doc in fused
+        ]
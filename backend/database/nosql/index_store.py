@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+import hashlib
+import faiss
+import json
+import uuid
+import os
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "data/vector_index")
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def document_text(doc: Dict[str, Any]) -> str:
+    """The text that gets embedded for a knowledge document."""
+    return f"{doc['title']}\n{doc['content']}\n{' '.join(doc['tags'])}"
+
+
+def document_key(doc: Dict[str, Any]) -> str:
+    """Stable identity for a document: its Mongo _id, or its title for documents that have none."""
+    return str(doc["_id"]) if doc.get("_id") is not None else doc["title"]
+
+
+def content_hash(text: str, model_name: str) -> str:
+    """Changes whenever the embedded text or the model producing the embedding changes."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+
+class PersistedIndex:
+    """What was loaded from disk: the manifest, a memory-mapped embedding matrix and the FAISS index."""
+
+    def __init__(self, manifest: Dict[str, Any], embeddings: np.ndarray, index: Optional[faiss.Index]):
+        self.manifest = manifest
+        self.embeddings = embeddings
+        self.index = index
+
+    @property
+    def hashes(self) -> List[str]:
+        return [entry["hash"] for entry in self.manifest["documents"]]
+
+    def rows_by_hash(self) -> Dict[str, int]:
+        return {content: row for row, content in enumerate(self.hashes)}
+
+
+class IndexStore:
+    """
+    On-disk home of the vector index.
+
+    The directory holds embeddings-<generation>.npy (float32, one row per document),
+    index-<generation>.faiss and manifest.json, which names the current generation's
+    files and lists each row's document key and content hash. Each save writes a new
+    generation and then swaps the manifest in with one rename, so a crash mid-save
+    leaves the previous generation intact.
+    """
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR):
+        self.directory = directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _read_index(path: str) -> faiss.Index:
+        try:
+            # Vectors stay in the page cache instead of being copied onto the heap
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            # Older FAISS builds can only mmap some index types
+            return faiss.read_index(path)
+
+    def load(self, model_name: str) -> Optional[PersistedIndex]:
+        """Load the persisted index, or None if there is none usable for this model."""
+        if not os.path.exists(self._path(MANIFEST_FILE)):
+            return None
+        try:
+            with open(self._path(MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != MANIFEST_VERSION or manifest.get("model") != model_name:
+                return None
+            embeddings = np.load(self._path(manifest["embeddings_file"]), mmap_mode="r")
+            rows = len(manifest["documents"])
+            dimension = manifest["dimension"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No usable vector index in {self.directory}: {str(e)}")
+            return None
+
+        if embeddings.shape != (rows, dimension) or embeddings.dtype != np.float32:
+            print(f"Vector index in {self.directory} does not match its manifest; ignoring it")
+            return None
+
+        index = None
+        index_path = self._path(manifest["index_file"])
+        if os.path.exists(index_path):
+            try:
+                index = self._read_index(index_path)
+            except RuntimeError as e:
+                print(f"Could not read {index_path}: {str(e)}")
+            if index is not None and index.ntotal != rows:
+                index = None
+        return PersistedIndex(manifest, embeddings, index)
+
+    def save(self, model_name: str, index_type: str, storage: str, keys: List[str], hashes: List[str],
+             embeddings: np.ndarray, index: faiss.Index) -> np.ndarray:
+        """
+        Persist the index and embedding matrix.
+
+        Returns:
+            np.ndarray: the embeddings, re-opened as a read-only memory map of the saved file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        generation = uuid.uuid4().hex[:12]
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "model": model_name,
+            "index_type": index_type,
+            "storage": storage,
+            "dimension": int(embeddings.shape[1]),
+            "embeddings_file": f"embeddings-{generation}.npy",
+            "index_file": f"index-{generation}.faiss",
+            "documents": [{"key": key, "hash": content} for key, content in zip(keys, hashes)],
+        }
+
+        with open(self._path(manifest["embeddings_file"]), "wb") as f:
+            np.save(f, embeddings)
+        faiss.write_index(index, self._path(manifest["index_file"]))
+
+        tmp_path = self._path(f"{MANIFEST_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(MANIFEST_FILE))
+
+        self._remove_old_generations(keep={manifest["embeddings_file"], manifest["index_file"]})
+        return np.load(self._path(manifest["embeddings_file"]), mmap_mode="r")
+
+    def _remove_old_generations(self, keep: set) -> None:
+        # Unlinking is safe even while another process still has an old generation mapped
+        for name in os.listdir(self.directory):
+            if name.startswith(("embeddings-", "index-")) and name not in keep:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
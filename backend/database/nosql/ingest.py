@@ -0,0 +1,331 @@
+"""
+Bulk-load knowledge documents into MongoDB and the persisted vector index.
+
+Reads a JSONL file, or a directory of .jsonl/.json files (a .json file may hold one
+document or a list), as a stream. Batches are encoded across a pool of worker
+processes while earlier batches are written to MongoDB with unordered bulk writes.
+Documents are upserted by title, so writing a batch twice is harmless.
+
+Embeddings are checkpointed under <VECTOR_INDEX_DIR>/ingest every
+INGEST_CHECKPOINT_DOCS documents. An interrupted run started again with the same
+source skips what was already checkpointed. Once the source is exhausted, the new
+embeddings are merged into the persisted index, so the next server start reuses
+them instead of re-encoding the collection.
+
+Usage:
+    python -m backend.database.nosql.ingest data/knowledge.jsonl --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from pydantic import ValidationError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from typing import Any, Dict, Iterator, List, Optional
+import multiprocessing
+import numpy as np
+import argparse
+import asyncio
+import shutil
+import json
+import time
+import os
+from backend.database.nosql.ann_index import VECTOR_INDEX_TYPE, VECTOR_STORAGE, build_index, choose_index_type
+from backend.database.nosql.index_store import VECTOR_INDEX_DIR, IndexStore, document_text, content_hash
+from backend.database.nosql.chunking import chunk_document
+from backend.database.nosql.vector_search import EMBEDDING_MODEL
+from backend.database.nosql.mongodb import MongoDBConnection
+from backend.database.nosql.model.battery_knowledge import BatteryKnowledge
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# 0 uses half the CPUs; each worker holds its own copy of the model
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+INGEST_CHECKPOINT_DOCS = int(os.getenv("INGEST_CHECKPOINT_DOCS", "4096"))
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+_worker_model = None
+
+
+def _init_worker(threads: int) -> None:
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # Workers split the cores between them instead of each spawning a thread per core
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(EMBEDDING_MODEL)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    # Same call as VectorSearch._encode_documents, so the server can reuse these vectors
+    return _worker_model.encode(texts, convert_to_tensor=True).cpu().numpy().astype("float32")
+
+
+def iter_source(path: str) -> Iterator[Dict[str, Any]]:
+    """Raw documents from a JSONL file or a directory of .jsonl/.json files, in a stable order."""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.endswith((".jsonl", ".json"))
+        )
+    else:
+        files = [path]
+
+    for file_path in files:
+        with open(file_path) as f:
+            if file_path.endswith(".json"):
+                loaded = json.load(f)
+                yield from loaded if isinstance(loaded, list) else [loaded]
+                continue
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class IngestCheckpoint:
+    """
+    Progress of one ingest run, kept next to the index it feeds.
+
+    Every flush writes a segment (segment-<n>.npy with its rows' keys, hashes and
+    passage numbers in segment-<n>.json) and then swaps in checkpoint.json, which records the source,
+    how many source documents are covered and how many segments are complete.
+    Segments written after the last swap are simply overwritten on resume.
+    """
+
+    def __init__(self, directory: str, source: str):
+        self.directory = directory
+        self.source = source
+        self.position = 0
+        self.segments = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self) -> bool:
+        """Pick up a previous run over the same source; returns whether there was one."""
+        try:
+            with open(self._path(CHECKPOINT_FILE)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get("source") != self.source or saved.get("model") != EMBEDDING_MODEL:
+            print(f"Ignoring checkpoint in {self.directory}: it belongs to another source or model")
+            return False
+        self.position = saved["position"]
+        self.segments = saved["segments"]
+        return True
+
+    def flush(self, position: int, keys: List[str], hashes: List[str], passages: List[int],
+              embeddings: np.ndarray) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment-{self.segments:06d}"
+        with open(self._path(f"{name}.npy"), "wb") as f:
+            np.save(f, embeddings)
+        with open(self._path(f"{name}.json"), "w") as f:
+            json.dump({"keys": keys, "hashes": hashes, "passages": passages}, f)
+
+        tmp_path = self._path(f"{CHECKPOINT_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "model": EMBEDDING_MODEL, "position": position,
+                       "segments": self.segments + 1}, f)
+        os.replace(tmp_path, self._path(CHECKPOINT_FILE))
+        self.position = position
+        self.segments += 1
+
+    def read_segments(self):
+        """All checkpointed (keys, hashes, passage numbers, embeddings), in ingest order."""
+        keys: List[str] = []
+        hashes: List[str] = []
+        passages: List[int] = []
+        chunks: List[np.ndarray] = []
+        for n in range(self.segments):
+            name = f"segment-{n:06d}"
+            with open(self._path(f"{name}.json")) as f:
+                segment = json.load(f)
+            keys.extend(segment["keys"])
+            hashes.extend(segment["hashes"])
+            passages.extend(segment["passages"])
+            chunks.append(np.load(self._path(f"{name}.npy")))
+        return keys, hashes, passages, chunks
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Ingest:
+    """One ingest run: read, encode in worker processes, write to MongoDB, checkpoint, merge."""
+
+    def __init__(self, source: str, collection, store: IndexStore, batch_size: int = INGEST_BATCH_SIZE,
+                 workers: int = INGEST_WORKERS, checkpoint_docs: int = INGEST_CHECKPOINT_DOCS):
+        self.source = os.path.abspath(source)
+        self.collection = collection
+        self.store = store
+        self.batch_size = batch_size
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.checkpoint_docs = checkpoint_docs
+        self.checkpoint = IngestCheckpoint(os.path.join(store.directory, "ingest"), self.source)
+
+        self.written = 0
+        self.rejected = 0
+        self.write_errors = 0
+        self._last_position = 0
+        self._pending_documents = 0
+        self._pending_keys: List[str] = []
+        self._pending_hashes: List[str] = []
+        self._pending_passages: List[int] = []
+        self._pending_embeddings: List[np.ndarray] = []
+
+    def _batches(self, skip: int) -> Iterator[tuple]:
+        """(source position after the batch, validated documents) for everything past `skip`."""
+        batch = []
+        position = yielded = skip
+        for position, raw in enumerate(iter_source(self.source), start=1):
+            if position <= skip:
+                continue
+            try:
+                batch.append(BatteryKnowledge(**raw).model_dump())
+            except (ValidationError, TypeError) as e:
+                self.rejected += 1
+                print(f"Skipping document {position}: {str(e).splitlines()[0]}")
+            if len(batch) >= self.batch_size:
+                yield position, batch
+                batch, yielded = [], position
+        # Also covers a tail of rejected documents, so a resumed run does not revisit them
+        if position > yielded:
+            yield position, batch
+
+    async def run(self, restart: bool = False) -> None:
+        if restart:
+            self.checkpoint.clear()
+        elif self.checkpoint.load():
+            print(f"Resuming after document {self.checkpoint.position} ({self.checkpoint.segments} segments)")
+
+        loop = asyncio.get_running_loop()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        started = time.perf_counter()
+        # Spawned, not forked: a forked copy of an initialized torch runtime can deadlock
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            in_flight = deque()
+            for position, batch in self._batches(self.checkpoint.position):
+                # Embedded passage by passage, exactly as VectorSearch indexes documents
+                passages = [chunk_document(doc) for doc in batch]
+                texts = [document_text(passage) for doc_passages in passages for passage in doc_passages]
+                encoding = loop.run_in_executor(pool, _encode, texts) if texts else None
+                in_flight.append((position, batch, passages, texts, encoding))
+                # Keep every worker busy while bounding how many batches sit in memory
+                if len(in_flight) >= 2 * self.workers:
+                    await self._write(*in_flight.popleft(), started)
+            while in_flight:
+                await self._write(*in_flight.popleft(), started)
+        if self._pending_keys:
+            self._flush(self._last_position)
+
+        await loop.run_in_executor(None, self._merge_into_index)
+        self.checkpoint.clear()
+
+        elapsed = time.perf_counter() - started
+        print(f"Ingest finished: {self.written} documents written, {self.rejected} rejected, "
+              f"{self.write_errors} write errors in {elapsed:.1f}s ({self.written / max(elapsed, 1e-9):.1f} docs/sec)")
+
+    async def _write(self, position: int, batch: List[Dict[str, Any]], passages: List[List[Dict[str, Any]]],
+                     texts: List[str], encoding, started: float) -> None:
+        self._last_position = position
+        if batch:
+            embeddings = await encoding
+            keys = await self._write_documents(batch)
+            hashes = [content_hash(text, EMBEDDING_MODEL) for text in texts]
+            row = 0
+            for key, doc_passages in zip(keys, passages):
+                # A document whose write failed has no _id and stays out of the index
+                if key is not None:
+                    self._pending_documents += 1
+                    for offset, passage in enumerate(doc_passages):
+                        self._pending_keys.append(key)
+                        self._pending_hashes.append(hashes[row + offset])
+                        self._pending_passages.append(passage["passage"])
+                        self._pending_embeddings.append(embeddings[row + offset])
+                row += len(doc_passages)
+
+        if self._pending_documents >= self.checkpoint_docs:
+            self._flush(position)
+            elapsed = time.perf_counter() - started
+            print(f"Checkpoint at document {position}: {self.written} written ({self.written / elapsed:.1f} docs/sec)")
+
+    async def _write_documents(self, batch: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Upsert a batch by title; returns each document's _id as a string, or None if it failed."""
+        requests = [ReplaceOne({"title": doc["title"]}, doc, upsert=True) for doc in batch]
+        failed = set()
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every other write in the batch went through
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            for error in e.details.get("writeErrors", [])[:3]:
+                print(f"Write error for '{batch[error['index']]['title']}': {error.get('errmsg')}")
+            self.write_errors += len(failed)
+
+        titles = [doc["title"] for i, doc in enumerate(batch) if i not in failed]
+        ids = {}
+        async for doc in self.collection.find({"title": {"$in": titles}}, {"title": 1}):
+            ids[doc["title"]] = str(doc["_id"])
+        self.written += len(titles)
+        return [None if i in failed else ids.get(doc["title"]) for i, doc in enumerate(batch)]
+
+    def _flush(self, position: int) -> None:
+        self.checkpoint.flush(position, self._pending_keys, self._pending_hashes, self._pending_passages,
+                              np.stack(self._pending_embeddings))
+        self._pending_documents = 0
+        self._pending_keys, self._pending_hashes, self._pending_passages, self._pending_embeddings = [], [], [], []
+
+    def _merge_into_index(self) -> None:
+        """Fold the checkpointed segments into the persisted index as one new generation."""
+        keys, hashes, passages, chunks = self.checkpoint.read_segments()
+        if not keys:
+            print("Nothing new to add to the vector index")
+            return
+        embeddings = np.concatenate(chunks)
+
+        # Later copies win: a document ingested twice, or already indexed, keeps its newest passages
+        latest: Dict[str, List[int]] = {}
+        for row, (key, passage) in enumerate(zip(keys, passages)):
+            if passage == 0:
+                latest[key] = []
+            latest[key].append(row)
+        rows = sorted(row for key_rows in latest.values() for row in key_rows)
+        persisted = self.store.load(EMBEDDING_MODEL)
+        if persisted is not None:
+            kept = [row for row, entry in enumerate(persisted.manifest["documents"]) if entry["key"] not in latest]
+            keys = [persisted.manifest["documents"][row]["key"] for row in kept] + [keys[row] for row in rows]
+            hashes = [persisted.hashes[row] for row in kept] + [hashes[row] for row in rows]
+            embeddings = np.concatenate([persisted.embeddings[kept], embeddings[rows]])
+        else:
+            keys = [keys[row] for row in rows]
+            hashes = [hashes[row] for row in rows]
+            embeddings = embeddings[rows]
+
+        index_type = choose_index_type(len(keys), VECTOR_INDEX_TYPE)
+        index = build_index(embeddings, index_type, ids=np.arange(len(keys)), storage=VECTOR_STORAGE)
+        self.store.save(EMBEDDING_MODEL, index_type, VECTOR_STORAGE, keys, hashes, embeddings, index)
+        print(f"Vector index in {self.store.directory} now holds {len(keys)} passages")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="JSONL file, or a directory of .jsonl/.json files")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="encoder processes (0: half the CPUs)")
+    parser.add_argument("--checkpoint-docs", type=int, default=INGEST_CHECKPOINT_DOCS)
+    parser.add_argument("--index-dir", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start from the beginning")
+    args = parser.parse_args()
+
+    collection = MongoDBConnection().get_collection(BatteryKnowledge.Config.collection_name)
+    ingest = Ingest(args.source, collection, IndexStore(args.index_dir), batch_size=args.batch_size,
+                    workers=args.workers, checkpoint_docs=args.checkpoint_docs)
+    await ingest.run(restart=args.restart)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
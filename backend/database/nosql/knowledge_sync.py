@@ -0,0 +1,116 @@
+from pymongo.errors import OperationFailure, PyMongoError
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import os
+from backend.executors import run_encoder
+from backend.database.nosql.vector_search import VectorSearch
+
+CORPUS_BATCH_SIZE = int(os.getenv("CORPUS_BATCH_SIZE", "256"))
+KNOWLEDGE_SYNC_RETRY_SECONDS = float(os.getenv("KNOWLEDGE_SYNC_RETRY_SECONDS", "5"))
+
+# Only what the index embeds and what retrieval returns; _id is always included
+KNOWLEDGE_PROJECTION = {"title": 1, "content": 1, "category": 1, "tags": 1, "source": 1}
+
+CHANGE_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+
+# "The $changeStream stage is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+def project_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply KNOWLEDGE_PROJECTION to a full document, e.g. one from a change event."""
+    return {key: doc[key] for key in ("_id", *KNOWLEDGE_PROJECTION) if key in doc}
+
+
+async def iter_knowledge_batches(collection, batch_size: int = CORPUS_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Read the collection through a projected cursor, batch_size documents per round trip."""
+    cursor = collection.find({}, KNOWLEDGE_PROJECTION, batch_size=batch_size)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class KnowledgeSync:
+    """Applies change-stream events from the knowledge collection to the live vector index."""
+
+    def __init__(self, collection, vector_search: VectorSearch):
+        self.collection = collection
+        self.vector_search = vector_search
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self.applied = 0
+
+    def start(self, start_at=None) -> None:
+        """
+        Begin following the collection.
+
+        Args:
+            start_at: cluster time to replay changes from, taken before the initial scan
+                so edits made while the index was being built are not lost
+        """
+        self._task = asyncio.create_task(self._run(start_at))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, start_at) -> None:
+        while True:
+            if self._resume_token is not None:
+                options = {"resume_after": self._resume_token}
+            elif start_at is not None:
+                options = {"start_at_operation_time": start_at}
+            else:
+                options = {}
+            try:
+                async with self.collection.watch(CHANGE_PIPELINE, full_document="updateLookup", **options) as stream:
+                    print("Following knowledge collection changes")
+                    async for change in stream:
+                        await self._apply(change)
+                        self._resume_token = stream.resume_token
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    print("Knowledge sync disabled: change streams need MongoDB to run as a replica set")
+                    return
+                print(f"Knowledge sync interrupted: {str(e)}")
+            except PyMongoError as e:
+                print(f"Knowledge sync interrupted: {str(e)}")
+            await asyncio.sleep(KNOWLEDGE_SYNC_RETRY_SECONDS)
+
+    async def _apply(self, change: Dict[str, Any]) -> None:
+        if change["operationType"] == "delete":
+            await run_encoder(self.vector_search.delete, str(change["documentKey"]["_id"]))
+        else:
+            doc = change.get("fullDocument")
+            if doc is None:
+                # Deleted again before the update could be looked up; its delete event follows
+                return
+            await run_encoder(self.vector_search.upsert, project_document(doc))
+        self.applied += 1
+
+
+async def load_knowledge_index(vector_search: VectorSearch, collection, watch: bool = True) -> Optional[KnowledgeSync]:
+    """
+    Build the vector index from the knowledge collection.
+
+    Returns:
+        Optional[KnowledgeSync]: the running sync keeping the index current, if watch is set
+    """
+    # On a replica set every reply carries the cluster time, which marks where to follow changes from
+    reply = await collection.database.command("ping")
+    await vector_search.acreate_index_from_batches(iter_knowledge_batches(collection))
+    if not watch:
+        return None
+    sync = KnowledgeSync(collection, vector_search)
+    sync.start(reply.get("operationTime"))
+    return sync
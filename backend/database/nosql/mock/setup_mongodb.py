@@ -36,9 +36,8 @@ async def setup_mongodb():
     else:
         print("Collection already contains data")
 
-    # Initialize vector search
-    documents = [knowledge.model_dump() for knowledge in BATTERY_KNOWLEDGE_DATA]
-    VectorRepository.initialize(documents)
+    # Build (and persist) the vector index from what is now in the collection
+    await VectorRepository.initialize_from_mongodb(watch=False)
     print("Vector search index created successfully")
 
     print("MongoDB setup completed successfully!")
@@ -1,10 +1,18 @@
 from typing import Optional
+from backend.executors import run_encoder
 from backend.database.nosql.vector_search import VectorSearch
+from backend.database.nosql.knowledge_sync import KnowledgeSync, load_knowledge_index
+from backend.database.nosql.hybrid_search import HybridRetriever
+from backend.database.nosql.mongodb import MongoDBConnection
+from backend.database.nosql.model.battery_knowledge import BatteryKnowledge
 from backend.database.nosql.mock.battery_knowledge import BATTERY_KNOWLEDGE_DATA
 
 class VectorRepository:
     _instance: Optional[VectorSearch] = None
     _initialized: bool = False
+    _sync: Optional[KnowledgeSync] = None
+    _collection = None
+    _retriever: Optional[HybridRetriever] = None
     
     @classmethod
     def get_instance(cls) -> VectorSearch:
@@ -19,12 +27,48 @@ class VectorRepository:
     @classmethod
     def initialize(cls, documents: list) -> None:
         """Initialize vector search with documents."""
-        instance = cls.get_instance()
-        instance.create_index(documents)
+        # Create the instance directly: get_instance() would first index the default data
+        if cls._instance is None:
+            cls._instance = VectorSearch()
+        cls._instance.create_index(documents)
         cls._initialized = True
     
     @classmethod
     def initialize_with_default_data(cls) -> None:
         """Initialize with default battery knowledge data."""
         documents = [knowledge.model_dump() for knowledge in BATTERY_KNOWLEDGE_DATA]
-        cls.initialize(documents) 
\ No newline at end of file
+        cls.initialize(documents) 
+
+    @classmethod
+    async def initialize_from_mongodb(cls, watch: bool = True) -> None:
+        """
+        Index the knowledge collection and, if watch is set, follow its changes.
+
+        Falls back to the bundled default data if MongoDB is unreachable or empty.
+        """
+        if cls._instance is None:
+            cls._instance = VectorSearch()
+        try:
+            collection = MongoDBConnection().get_collection(BatteryKnowledge.Config.collection_name)
+            cls._sync = await load_knowledge_index(cls._instance, collection, watch)
+            cls._collection = collection
+            cls._retriever = None
+            cls._initialized = True
+            return
+        except Exception as e:
+            print(f"Warning: could not index knowledge from MongoDB, using bundled data: {str(e)}")
+        await run_encoder(cls.initialize_with_default_data)
+
+    @classmethod
+    def get_retriever(cls) -> HybridRetriever:
+        """Hybrid text + vector retriever; vector-only when the index was not built from MongoDB."""
+        if cls._retriever is None:
+            cls._retriever = HybridRetriever(cls.get_instance(), cls._collection)
+        return cls._retriever
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """Stop following collection changes."""
+        if cls._sync is not None:
+            await cls._sync.stop()
+            cls._sync = None
@@ -1,57 +1,679 @@
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-from typing import List, Dict, Any
+from collections import OrderedDict, defaultdict
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional, Tuple
+import threading
+import asyncio
+import sys
 import os
+from backend.executors import run_encoder
+from backend.database.nosql.embedding_service import EmbeddingService
+from backend.database.nosql.ann_index import (
+    VECTOR_INDEX_TYPE, VECTOR_STORAGE, build_index, choose_index_type, set_search_params, search_parameters,
+    supports_selection, exact_rerank, describe_index,
+)
+from backend.database.nosql.index_store import (
+    VECTOR_INDEX_DIR, IndexStore, document_text, document_key, content_hash,
+)
+from backend.database.nosql.document_store import DocumentStore, DocumentView
+from backend.database.nosql.chunking import PASSAGES_PER_DOCUMENT, DocumentSpans, chunk_document
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Rebuild the index once this share of its vectors belong to deleted or replaced documents
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.2"))
+VECTOR_COMPACT_MIN_TOMBSTONES = int(os.getenv("VECTOR_COMPACT_MIN_TOMBSTONES", "64"))
+# Replaced content left in the document store also triggers compaction, past this size and the same ratio
+VECTOR_COMPACT_MIN_DEAD_BYTES = int(os.getenv("VECTOR_COMPACT_MIN_DEAD_BYTES", str(1024 * 1024)))
+# With quantized storage, fetch this many times k candidates and re-score them exactly
+# against the memory-mapped float32 embeddings (1 disables re-scoring)
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# Filtered searches over at most this many candidates are scored exactly instead of through the index
+VECTOR_FILTER_EXACT_MAX = int(os.getenv("VECTOR_FILTER_EXACT_MAX", "4096"))
+# Passages fetched per requested document, so that k distinct documents are usually found
+VECTOR_PASSAGE_FETCH_FACTOR = int(os.getenv("VECTOR_PASSAGE_FETCH_FACTOR", "4"))
+
+QUERY_EMBEDDING_CACHE_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_BYTES", str(8 * 1024 * 1024)))
+QUERY_EMBEDDING_CACHE_SHARED = os.getenv("QUERY_EMBEDDING_CACHE_SHARED", "true").lower() == "true"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Collapse case and whitespace and drop trailing punctuation. The model is uncased, and a
+    closing "?" barely moves the embedding, so "Show batteries?" and "show batteries" share
+    one cache entry here and in the question cache.
+    """
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+
+class QueryEmbeddingCache:
+    """LRU of normalized query text to float32 embedding, bounded by a byte budget."""
+
+    def __init__(self, max_bytes: int = QUERY_EMBEDDING_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_bytes(key: str, embedding: np.ndarray) -> int:
+        return sys.getsizeof(key) + embedding.nbytes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        embedding = np.array(embedding, dtype="float32")
+        # Cached arrays are handed to every caller, so nobody may modify them in place
+        embedding.setflags(write=False)
+        entry_bytes = self._entry_bytes(key, embedding)
+        if entry_bytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= self._entry_bytes(key, previous)
+            self._entries[key] = embedding
+            self.size += entry_bytes
+            while self.size > self.max_bytes:
+                old_key, old_embedding = self._entries.popitem(last=False)
+                self.size -= self._entry_bytes(old_key, old_embedding)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+_shared_query_cache: Optional[QueryEmbeddingCache] = None
+_shared_query_cache_lock = threading.Lock()
+
+
+def get_shared_query_cache() -> QueryEmbeddingCache:
+    """Process-wide query cache for components that embed the same questions."""
+    global _shared_query_cache
+    with _shared_query_cache_lock:
+        if _shared_query_cache is None:
+            _shared_query_cache = QueryEmbeddingCache()
+        return _shared_query_cache
+
 
 class VectorSearch:
-    def __init__(self):
+    def __init__(self, query_cache: Optional[QueryEmbeddingCache] = None, store: Optional[IndexStore] = None):
         # Initialize the sentence transformer model
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        # Query encodings from concurrent requests are micro-batched through this service
+        self.embedder = EmbeddingService(self.model)
+        if query_cache is None:
+            query_cache = get_shared_query_cache() if QUERY_EMBEDDING_CACHE_SHARED else QueryEmbeddingCache()
+        self.query_cache = query_cache
+        # An empty VECTOR_INDEX_DIR disables persistence
+        if store is None and VECTOR_INDEX_DIR:
+            store = IndexStore()
+        self.store = store
+
+        # Live index state. Documents are indexed as overlapping passages, one row each.
+        # FAISS ids are rows: documents[row] and the embedding at that row belong together,
+        # and a deleted or replaced document leaves tombstones (documents[row] is None)
+        # that searches skip until compaction drops them.
         self.index = None
-        self.documents = []
-        
-    def create_index(self, documents: List[Dict[str, Any]]):
-        """Create FAISS index from documents."""
-        # Create document texts for embedding
-        texts = [
-            f"{doc['title']}\n{doc['content']}\n{' '.join(doc['tags'])}"
-            for doc in documents
-        ]
-        
-        # Generate embeddings
+        self.index_type = VECTOR_INDEX_TYPE
+        # What create_index was asked for; "auto" is resolved again by size on compaction
+        self._requested_index_type = VECTOR_INDEX_TYPE
+        self.storage = VECTOR_STORAGE
+        self.embeddings = None
+        self.documents = DocumentStore()
+        self.hashes: List[str] = []
+        self._added_embeddings: List[np.ndarray] = []
+        # Passage rows of each document, in passage order
+        self._rows_by_key: Dict[str, List[int]] = {}
+        self._tombstones = set()
+        self._tombstone_selector = None
+        # Live rows per category and per tag, for pre-filtered searches
+        self._rows_by_category: Dict[str, set] = defaultdict(set)
+        self._rows_by_tag: Dict[str, set] = defaultdict(set)
+
+        # Searches and mutations of the live index take _lock; _write_lock orders writers
+        # so encoding a new document happens outside _lock without racing another upsert
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        # Bumped on every change, so a compaction can tell whether its snapshot went stale
+        self._generation = 0
+        self._compacting = False
+        self.compactions = 0
+
+    def create_index(self, documents: List[Dict[str, Any]], index_type: str = VECTOR_INDEX_TYPE,
+                     storage: str = VECTOR_STORAGE, **index_params):
+        """
+        Create FAISS index from documents; index_type "auto" picks one by corpus size.
+
+        storage selects how vectors are held inside the index (float32, fp16, sq8 or pq);
+        the full-precision embeddings stay on disk for exact re-scoring.
+
+        Embeddings of documents whose content hash matches the persisted manifest are
+        reused from disk, so only new or changed documents go through the model. When
+        nothing changed at all, the saved index itself is loaded instead of rebuilt.
+        """
+        persisted = self.store.load(EMBEDDING_MODEL) if self.store else None
+        known_rows = persisted.rows_by_hash() if persisted is not None else {}
+        documents = [passage for doc in documents for passage in chunk_document(doc)]
+        texts = [document_text(doc) for doc in documents]
+        hashes = [content_hash(text, EMBEDDING_MODEL) for text in texts]
+        missing = [i for i, content in enumerate(hashes) if content not in known_rows]
+        new_embeddings = self._encode_documents([texts[i] for i in missing]) if missing else None
+        embeddings = self._merge_embeddings(hashes, persisted, known_rows, missing, new_embeddings)
+        self._finish_index(documents, hashes, embeddings, len(missing), persisted, index_type, storage, index_params)
+
+    async def acreate_index_from_batches(self, batches: AsyncIterator[List[Dict[str, Any]]],
+                                         index_type: str = VECTOR_INDEX_TYPE, storage: str = VECTOR_STORAGE,
+                                         **index_params):
+        """
+        Create the index from an async stream of document batches, e.g. a database cursor.
+
+        Each batch is encoded as soon as it arrives while the next one is fetched, so the
+        raw corpus and the model's working tensors never have to be in memory all at once;
+        only the compact float32 embeddings accumulate until the index is built.
+        """
+        persisted = await run_encoder(self.store.load, EMBEDDING_MODEL) if self.store else None
+        known_rows = persisted.rows_by_hash() if persisted is not None else {}
+        # Batches go straight into the columnar store rather than piling up as dicts
+        documents = DocumentStore()
+        hashes: List[str] = []
+        chunks: List[np.ndarray] = []
+        encoded = 0
+
+        iterator = batches.__aiter__()
+        pending = asyncio.ensure_future(iterator.__anext__())
+        try:
+            while True:
+                try:
+                    batch = await pending
+                except StopAsyncIteration:
+                    break
+                # Fetch the next batch while this one is being encoded
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+                batch = [passage for doc in batch for passage in chunk_document(doc)]
+                texts = [document_text(doc) for doc in batch]
+                batch_hashes = [content_hash(text, EMBEDDING_MODEL) for text in texts]
+                missing = [i for i, content in enumerate(batch_hashes) if content not in known_rows]
+                new_embeddings = await run_encoder(self._encode_documents, [texts[i] for i in missing]) if missing else None
+                chunks.append(self._merge_embeddings(batch_hashes, persisted, known_rows, missing, new_embeddings))
+                documents.extend(batch)
+                hashes.extend(batch_hashes)
+                encoded += len(missing)
+        finally:
+            pending.cancel()
+
+        if not len(documents):
+            raise ValueError("No documents to index")
+        embeddings = np.concatenate(chunks)
+        await run_encoder(self._finish_index, documents, hashes, embeddings, encoded, persisted, index_type, storage,
+                          index_params)
+
+    @staticmethod
+    def _merge_embeddings(hashes: List[str], persisted, known_rows: Dict[str, int], missing: List[int],
+                          new_embeddings: Optional[np.ndarray]) -> np.ndarray:
+        """Combine embeddings reused from the persisted matrix with freshly encoded ones, in document order."""
+        dimension = new_embeddings.shape[1] if new_embeddings is not None else persisted.embeddings.shape[1]
+        embeddings = np.empty((len(hashes), dimension), dtype="float32")
+        for i, content in enumerate(hashes):
+            if content in known_rows:
+                embeddings[i] = persisted.embeddings[known_rows[content]]
+        if missing:
+            embeddings[missing] = new_embeddings
+        return embeddings
+
+    def _finish_index(self, documents: Iterable[Any], hashes: List[str], embeddings: np.ndarray,
+                      encoded: int, persisted, index_type: str, storage: str, index_params: Dict[str, Any]) -> None:
+        resolved_type = choose_index_type(len(documents), index_type)
+        if (persisted is not None and persisted.hashes == hashes and persisted.index is not None
+                and persisted.manifest["index_type"] == resolved_type
+                and persisted.manifest.get("storage", "float32") == storage
+                and isinstance(faiss.downcast_index(persisted.index), faiss.IndexIDMap2)
+                and supports_selection(persisted.index)):
+            # Nothing changed since the last save: serve the memory-mapped files as they are
+            set_search_params(persisted.index, nprobe=index_params.get("nprobe"), ef_search=index_params.get("ef_search"))
+            self._install(persisted.index, index_type, resolved_type, storage, documents, hashes, persisted.embeddings)
+            print(f"Vector index loaded from {self.store.directory} ({len(documents)} passages)")
+            return
+
+        # Build (and train, for IVF types) the FAISS index
+        index = build_index(embeddings, resolved_type, ids=np.arange(len(documents)), storage=storage, **index_params)
+        if self.store:
+            keys = [document_key(doc) for doc in documents]
+            embeddings = self.store.save(EMBEDDING_MODEL, resolved_type, storage, keys, hashes, embeddings, index)
+
+        self._install(index, index_type, resolved_type, storage, documents, hashes, embeddings)
+        print(f"Vector index built: {encoded} of {len(documents)} passages encoded")
+
+    def _install(self, index, requested_type: str, index_type: str, storage: str, documents: Iterable[Any],
+                 hashes: List[str], embeddings: np.ndarray) -> None:
+        """Swap in a freshly built index of index_type whose ids are 0..len(documents)-1."""
+        if not isinstance(documents, DocumentStore):
+            documents = DocumentStore.from_documents(documents)
+        with self._lock:
+            self.index = index
+            self._requested_index_type = requested_type
+            self.index_type = index_type
+            self.storage = storage
+            self.documents = documents
+            self.hashes = list(hashes)
+            self.embeddings = embeddings
+            self._added_embeddings = []
+            rows_by_key = defaultdict(list)
+            for doc in documents:
+                rows_by_key[document_key(doc)].append(doc.row)
+            self._rows_by_key = dict(rows_by_key)
+            self._tombstones = set()
+            self._tombstone_selector = None
+            self._rows_by_category = defaultdict(set)
+            self._rows_by_tag = defaultdict(set)
+            for doc in documents:
+                self._index_metadata(doc.row, doc)
+            self._generation += 1
+
+    def _index_metadata(self, row: int, doc: Dict[str, Any]) -> None:
+        self._rows_by_category[doc.get("category")].add(row)
+        for tag in doc.get("tags", []):
+            self._rows_by_tag[tag].add(row)
+
+    def _unindex_metadata(self, row: int, doc: Dict[str, Any]) -> None:
+        self._rows_by_category[doc.get("category")].discard(row)
+        for tag in doc.get("tags", []):
+            self._rows_by_tag[tag].discard(row)
+
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
         embeddings = self.model.encode(texts, convert_to_tensor=True)
-        embeddings = embeddings.cpu().numpy()  # Convert to numpy array
-        
-        # Initialize FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        
-        # Add vectors to the index
-        self.index.add(embeddings.astype('float32'))
-        
-        # Store original documents
-        self.documents = documents
-        
-    def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        """Search for most similar documents."""
+        return embeddings.cpu().numpy().astype('float32')  # Convert to numpy array
+
+    def upsert(self, doc: Dict[str, Any]) -> bool:
+        """
+        Add a document, or replace the one with the same key, without rebuilding the index.
+
+        Returns:
+            bool: True if the document was embedded, False if only its metadata changed
+        """
+        if self.index is None:
+            raise ValueError("Index not created. Call create_index first.")
+        key = document_key(doc)
+        passages = chunk_document(doc)
+        texts = [document_text(passage) for passage in passages]
+        new_hashes = [content_hash(text, EMBEDDING_MODEL) for text in texts]
+
+        with self._write_lock:
+            with self._lock:
+                rows = self._rows_by_key.get(key, [])
+                metadata_only = [self.hashes[row] for row in rows] == new_hashes
+                if metadata_only:
+                    # Same embedded text; category, last_updated etc. can change in place
+                    for row, passage in zip(rows, passages):
+                        self._unindex_metadata(row, self.documents[row])
+                        self.documents[row] = passage
+                        self._index_metadata(row, passage)
+                    # A compaction working from an older snapshot must not swap these changes out
+                    self._generation += 1
+
+            if metadata_only:
+                self._maybe_compact()
+                return False
+
+            embeddings = self._encode_documents(texts)
+
+            with self._lock:
+                first_row = len(self.documents)
+                new_rows = list(range(first_row, first_row + len(passages)))
+                self.index.add_with_ids(embeddings, np.array(new_rows, dtype="int64"))
+                self._added_embeddings.extend(embeddings)
+                for row, passage, new_hash in zip(new_rows, passages, new_hashes):
+                    self.documents.append(passage)
+                    self.hashes.append(new_hash)
+                    self._index_metadata(row, passage)
+                for old_row in self._rows_by_key.get(key, []):
+                    self._tombstone(old_row)
+                self._rows_by_key[key] = new_rows
+                self._generation += 1
+
+        self._maybe_compact()
+        return True
+
+    def delete(self, key: str) -> bool:
+        """Remove the document with this key (see document_key); returns False if there was none."""
+        with self._write_lock, self._lock:
+            rows = self._rows_by_key.pop(key, None)
+            if rows is None:
+                return False
+            for row in rows:
+                self._tombstone(row)
+            self._generation += 1
+
+        self._maybe_compact()
+        return True
+
+    def _tombstone(self, row: int) -> None:
+        self._unindex_metadata(row, self.documents[row])
+        self.documents[row] = None
+        self._tombstones.add(row)
+        self._tombstone_selector = None
+
+    def _search_params(self):
+        """Search parameters that exclude tombstoned rows, or None when there are none."""
+        if not self._tombstones:
+            return None
+        if self._tombstone_selector is None:
+            deleted = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype="int64"))
+            # Keep a reference to the inner selector: FAISS does not own it
+            self._tombstone_selector = (deleted, faiss.IDSelectorNot(deleted))
+        return search_parameters(self.index, self._tombstone_selector[1])
+
+    def _filter_rows(self, category: Optional[str], tags: Optional[List[str]]) -> Optional[set]:
+        """Live rows in the category and carrying every tag, or None when there is no filter."""
+        candidates = []
+        if category:
+            candidates.append(self._rows_by_category.get(category, set()))
+        for tag in tags or []:
+            candidates.append(self._rows_by_tag.get(tag, set()))
+        if not candidates:
+            return None
+        candidates.sort(key=len)
+        return candidates[0].intersection(*candidates[1:])
+
+    def _embedding_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Gather embeddings by row from the persisted matrix and the vectors added since."""
+        base = len(self.embeddings)
+        out = np.empty((len(rows), self.embeddings.shape[1]), dtype="float32")
+        in_base = rows < base
+        out[in_base] = self.embeddings[rows[in_base]]
+        if not in_base.all():
+            added = np.stack(self._added_embeddings)
+            out[~in_base] = added[rows[~in_base] - base]
+        return out
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            tombstones = len(self._tombstones)
+            dead_bytes = self.documents.dead_bytes
+            due = not self._compacting and (
+                (tombstones >= VECTOR_COMPACT_MIN_TOMBSTONES
+                 and tombstones >= VECTOR_COMPACT_RATIO * self.index.ntotal)
+                or (dead_bytes >= VECTOR_COMPACT_MIN_DEAD_BYTES
+                    and dead_bytes >= VECTOR_COMPACT_RATIO * self.documents.stats()["content_bytes"])
+            )
+            if due:
+                self._compacting = True
+        if due:
+            threading.Thread(target=self._compact_in_background, name="vector-compaction", daemon=True).start()
+
+    def _compact_in_background(self) -> None:
+        retry = False
+        try:
+            retry = not self.compact()
+        except Exception as e:
+            print(f"Error compacting vector index: {str(e)}")
+        finally:
+            self._compacting = False
+        if retry:
+            # Writes that landed during an abandoned attempt skipped scheduling one of their own
+            self._maybe_compact()
+
+    def compact(self) -> bool:
+        """
+        Rebuild the index without tombstones, and the document store without dead content.
+
+        The rebuild runs on a snapshot while searches and upserts continue against the
+        live index. If anything changed in the meantime the result is discarded; the next
+        upsert or delete schedules another attempt.
+
+        Returns:
+            bool: True if the compacted index was swapped in
+        """
+        with self._lock:
+            if not self._tombstones and not self.documents.dead_bytes:
+                return False
+            generation = self._generation
+            rows = np.array([doc.row for doc in self.documents], dtype="int64")
+            documents = self.documents.take(rows)
+            hashes = [self.hashes[row] for row in rows]
+            embeddings = self._embedding_rows(rows)
+            index_type = self._requested_index_type
+            storage = self.storage
+
+        resolved_type = choose_index_type(len(documents), index_type)
+        index = build_index(embeddings, resolved_type, ids=np.arange(len(documents)), storage=storage)
+
+        with self._lock:
+            if self._generation != generation:
+                print("Vector index compaction abandoned: the index changed while it ran")
+                return False
+            # Carry over query-time knobs that were tuned on the live index
+            info = describe_index(self.index)
+        set_search_params(index, nprobe=info.get("nprobe"), ef_search=info.get("ef_search"))
+        if self.store:
+            keys = [document_key(doc) for doc in documents]
+            embeddings = self.store.save(EMBEDDING_MODEL, resolved_type, storage, keys, hashes, embeddings, index)
+
+        with self._lock:
+            if self._generation != generation:
+                print("Vector index compaction abandoned: the index changed while it ran")
+                return False
+            self._install(index, index_type, resolved_type, storage, documents, hashes, embeddings)
+            self.compactions += 1
+        print(f"Vector index compacted to {len(documents)} passages")
+        return True
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+        """Trade recall for latency at query time (IVF nprobe, HNSW efSearch)."""
+        if not self.index:
+            raise ValueError("Index not created. Call create_index first.")
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def index_info(self) -> Dict[str, Any]:
+        with self._lock:
+            if not self.index:
+                return {}
+            info = describe_index(self.index)
+            info.update(
+                documents=len(self._rows_by_key),
+                passages=self.documents.live_count,
+                tombstones=len(self._tombstones),
+                compactions=self.compactions,
+                document_store=self.documents.stats(),
+            )
+            return info
+
+    def search(self, query: str, k: int = 3, category: Optional[str] = None,
+               tags: Optional[List[str]] = None) -> List[DocumentSpans]:
+        """Search for most similar documents, optionally only those in a category and carrying all tags."""
         if not self.index:
             raise ValueError("Index not created. Call create_index first.")
             
-        # Generate query embedding
-        query_embedding = self.model.encode([query])
-        query_embedding = query_embedding.reshape(1, -1)
-        
-        # Search in FAISS index
-        distances, indices = self.index.search(query_embedding.astype('float32'), k)
-        
-        # Get results with similarity scores
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx < len(self.documents):  # Check if index is valid
-                doc = self.documents[idx].copy()
-                # Convert distance to similarity score (1 / (1 + distance))
-                doc['relevance_score'] = float(1 / (1 + distance))
-                results.append(doc)
-                
-        return results 
\ No newline at end of file
+        return self.search_by_embedding(self.encode_query(query), k, category, tags)
+
+    def search_batch(self, queries: List[str], k: int = 3, category: Optional[str] = None,
+                     tags: Optional[List[str]] = None) -> List[List[DocumentSpans]]:
+        """Search for many queries at once: one encode pass and one index search over the query matrix."""
+        if not self.index:
+            raise ValueError("Index not created. Call create_index first.")
+
+        return self.search_batch_by_embedding(self.encode_queries(queries), k, category, tags)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embed a query, skipping the model for text seen recently."""
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.embedder.encode([key])[0]
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    async def aencode_query(self, query: str) -> np.ndarray:
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = (await self.embedder.aencode([key]))[0]
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries as one matrix; only distinct texts missing from the cache reach the model."""
+        keys, found, missing = self._cached_queries(queries)
+        if missing:
+            self._cache_queries(found, missing, self.embedder.encode(missing))
+        return self._stack_queries(keys, found)
+
+    async def aencode_queries(self, queries: List[str]) -> np.ndarray:
+        keys, found, missing = self._cached_queries(queries)
+        if missing:
+            self._cache_queries(found, missing, await self.embedder.aencode(missing))
+        return self._stack_queries(keys, found)
+
+    def _cached_queries(self, queries: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], List[str]]:
+        """Normalized keys, the cached embeddings among them, and the distinct keys still to encode."""
+        keys = [normalize_query(query) for query in queries]
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            embedding = self.query_cache.get(key)
+            if embedding is None:
+                missing.append(key)
+            else:
+                found[key] = embedding
+        return keys, found, missing
+
+    def _stack_queries(self, keys: List[str], found: Dict[str, np.ndarray]) -> np.ndarray:
+        if not keys:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype="float32")
+        return np.stack([found[key] for key in keys])
+
+    def _cache_queries(self, found: Dict[str, np.ndarray], missing: List[str], embeddings: np.ndarray) -> None:
+        for key, embedding in zip(missing, embeddings):
+            self.query_cache.put(key, embedding)
+            found[key] = embedding
+
+    def search_by_embedding(self, query_embedding: np.ndarray, k: int = 3, category: Optional[str] = None,
+                            tags: Optional[List[str]] = None) -> List[DocumentSpans]:
+        """Search with an already-encoded query."""
+        return self.search_batch_by_embedding(query_embedding.reshape(1, -1), k, category, tags)[0]
+
+    def search_batch_by_embedding(self, query_embeddings: np.ndarray, k: int = 3, category: Optional[str] = None,
+                                  tags: Optional[List[str]] = None) -> List[List[DocumentSpans]]:
+        """
+        Search with a matrix of encoded queries, one row per query; returns one hit list per row.
+
+        Each hit is a document carrying its best matching passages (see DocumentSpans),
+        scored by its nearest passage.
+        """
+        if not self.index:
+            raise ValueError("Index not created. Call create_index first.")
+
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        if not len(query_embeddings):
+            return []
+
+        # Several passages of one document can rank high; fetch enough to find k documents
+        passages = k * VECTOR_PASSAGE_FETCH_FACTOR
+        # Quantized codes only approximate distances; over-fetch and re-rank exactly
+        rescore = self.storage != "float32" and VECTOR_RESCORE_FACTOR > 1
+        fetch = passages * VECTOR_RESCORE_FACTOR if rescore else passages
+
+        with self._lock:
+            allowed = self._filter_rows(category, tags)
+            if allowed is None:
+                # Search in FAISS index
+                distances, indices = self.index.search(query_embeddings, fetch, params=self._search_params())
+            elif len(allowed) <= VECTOR_FILTER_EXACT_MAX:
+                # A small candidate set is cheaper to score directly than to search for
+                rows = np.fromiter(allowed, dtype="int64", count=len(allowed))
+                vectors = self._embedding_rows(rows)
+                ranked = [exact_rerank(query, rows, vectors, passages) for query in query_embeddings]
+                distances = np.stack([row_distances for row_distances, _ in ranked])
+                indices = np.stack([row_ids for _, row_ids in ranked])
+                rescore = False
+            else:
+                # Only the allowed ids are visited; tombstones are never in the allowed set
+                selector = faiss.IDSelectorBatch(np.fromiter(allowed, dtype="int64", count=len(allowed)))
+                distances, indices = self.index.search(query_embeddings, fetch, params=search_parameters(self.index, selector))
+
+            results = []
+            for query, row_distances, row_ids in zip(query_embeddings, distances, indices):
+                if rescore:
+                    # FAISS pads with -1 when fewer than k vectors qualify
+                    candidates = row_ids[row_ids >= 0]
+                    row_distances, row_ids = exact_rerank(query, candidates, self._embedding_rows(candidates), passages)
+                results.append(self._group_passages([
+                    (self.documents[idx], distance)
+                    for idx, distance in zip(row_ids, row_distances)
+                    # FAISS pads with -1 when fewer than k vectors qualify
+                    if 0 <= idx < len(self.documents) and self.documents[idx] is not None
+                ], k))
+        return results
+
+    @staticmethod
+    def _group_passages(hits: List[Tuple[DocumentView, float]], k: int) -> List[DocumentSpans]:
+        """Gather passage hits (nearest first) by document: the k documents with the nearest passages."""
+        groups: Dict[str, List[Tuple[DocumentView, float]]] = {}
+        for passage, distance in hits:
+            key = document_key(passage)
+            group = groups.get(key)
+            if group is None:
+                if len(groups) == k:
+                    continue
+                group = groups[key] = []
+            if len(group) < PASSAGES_PER_DOCUMENT:
+                group.append((passage, distance))
+        # Convert distance to similarity score (1 / (1 + distance)); views share the stored fields
+        return [
+            DocumentSpans([passage for passage, _ in group], float(1 / (1 + group[0][1])))
+            for group in groups.values()
+        ]
+
+    def document_spans(self, query_embedding: np.ndarray, keys: List[str]) -> Dict[str, DocumentSpans]:
+        """The passages of each listed document that best match the query, e.g. for hits found by text search."""
+        query_embedding = np.asarray(query_embedding, dtype="float32").reshape(-1)
+        spans = {}
+        with self._lock:
+            for key in keys:
+                rows = self._rows_by_key.get(key)
+                if not rows:
+                    continue
+                rows = np.array(rows, dtype="int64")
+                distances, ids = exact_rerank(query_embedding, rows, self._embedding_rows(rows), PASSAGES_PER_DOCUMENT)
+                spans[key] = DocumentSpans([self.documents[row] for row in ids], float(1 / (1 + distances[0])))
+        return spans
+
+    async def asearch(self, query: str, k: int = 3, category: Optional[str] = None,
+                      tags: Optional[List[str]] = None) -> List[DocumentSpans]:
+        """Search without blocking the event loop."""
+        query_embedding = await self.aencode_query(query)
+        return await run_encoder(self.search_by_embedding, query_embedding, k, category, tags)
+
+    async def asearch_batch(self, queries: List[str], k: int = 3, category: Optional[str] = None,
+                            tags: Optional[List[str]] = None) -> List[List[DocumentSpans]]:
+        """search_batch without blocking the event loop."""
+        query_embeddings = await self.aencode_queries(queries)
+        return await run_encoder(self.search_batch_by_embedding, query_embeddings, k, category, tags)
@@ -1,4 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+import threading
+import time
 import os
 
 # Mapping of database names to their connection strings.
@@ -7,15 +13,231 @@ DATABASES = {
     # To add more databases, include additional key/value pairs.
 }
 
-def get_engine(database_name: str = "default"):
-    """Get SQLAlchemy engine for the specified database."""
+# Connection pool settings, shared by every engine in the registry.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Async drivers used for request-path execution, keyed by the sync dialect.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Process-wide engine registries keyed by target database name.
+_engines: Dict[str, Engine] = {}
+_pool_metrics: Dict[str, "PoolMetrics"] = {}
+_async_engines: Dict[str, AsyncEngine] = {}
+_async_pool_metrics: Dict[str, "PoolMetrics"] = {}
+_registry_lock = threading.Lock()
+
+
+class PoolMetrics:
+    """Counters for connection pool checkouts and checkout wait time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def snapshot(self, engine: Engine) -> dict:
+        pool = engine.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "avg_wait_ms": (self.total_wait_seconds / self.waits * 1000) if self.waits else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+
+def _resolve_database_url(database_name: str) -> str:
+    """Return the connection string configured for a database name."""
     if database_name != "default":
         raise ValueError(f"Database '{database_name}' not configured")
-    
+
     # Get database URL from environment variable
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable not set")
-    
-    # Create and return the engine
-    return create_engine(database_url)
\ No newline at end of file
+    return database_url
+
+
+def _attach_pool_listeners(engine: Engine, metrics: PoolMetrics) -> None:
+    """Count pool events for the metrics endpoint."""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.checkins += 1
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+
+def get_engine(database_name: str = "default") -> Engine:
+    """Get the shared SQLAlchemy engine for the specified database."""
+    engine = _engines.get(database_name)
+    if engine is not None:
+        return engine
+
+    database_url = _resolve_database_url(database_name)
+    with _registry_lock:
+        engine = _engines.get(database_name)
+        if engine is None:
+            engine = create_engine(
+                database_url,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_recycle=POOL_RECYCLE,
+                pool_timeout=POOL_TIMEOUT,
+                pool_pre_ping=True,
+            )
+            metrics = PoolMetrics()
+            _attach_pool_listeners(engine, metrics)
+            _pool_metrics[database_name] = metrics
+            _engines[database_name] = engine
+    return engine
+
+
+def _to_async_url(database_url: str):
+    """Translate a sync connection string to its async-driver equivalent."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+
+    connect_args = {}
+    query = dict(url.query)
+    # asyncpg does not understand libpq's sslmode; map it onto its ssl flag.
+    sslmode = query.pop("sslmode", None)
+    if sslmode is not None and backend == "postgresql":
+        connect_args["ssl"] = sslmode not in ("disable", "allow", "prefer")
+    return url.set(drivername=ASYNC_DRIVERS[backend], query=query), connect_args
+
+
+def get_async_engine(database_name: str = "default") -> AsyncEngine:
+    """Get the shared async engine used to execute queries on the request path."""
+    engine = _async_engines.get(database_name)
+    if engine is not None:
+        return engine
+
+    async_url, connect_args = _to_async_url(_resolve_database_url(database_name))
+    with _registry_lock:
+        engine = _async_engines.get(database_name)
+        if engine is None:
+            engine = create_async_engine(
+                async_url,
+                connect_args=connect_args,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_recycle=POOL_RECYCLE,
+                pool_timeout=POOL_TIMEOUT,
+                pool_pre_ping=True,
+            )
+            metrics = PoolMetrics()
+            _attach_pool_listeners(engine.sync_engine, metrics)
+            _async_pool_metrics[database_name] = metrics
+            _async_engines[database_name] = engine
+    return engine
+
+
+@contextmanager
+def connect(database_name: str = "default"):
+    """Check out a pooled connection, recording how long the checkout waited."""
+    engine = get_engine(database_name)
+    started = time.perf_counter()
+    connection = engine.connect()
+    _pool_metrics[database_name].record_wait(time.perf_counter() - started)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+@asynccontextmanager
+async def async_connect(database_name: str = "default"):
+    """Async counterpart of connect() backed by the async engine registry."""
+    engine = get_async_engine(database_name)
+    started = time.perf_counter()
+    connection = await engine.connect()
+    _async_pool_metrics[database_name].record_wait(time.perf_counter() - started)
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+
+def warm_up_engines() -> None:
+    """Create the engine for every configured database and open one connection."""
+    for database_name in DATABASES:
+        try:
+            with connect(database_name):
+                pass
+            print(f"Connection pool warmed up for database '{database_name}'")
+        except Exception as e:
+            print(f"Warning: could not warm up database '{database_name}': {str(e)}")
+
+
+async def warm_up_async_engines() -> None:
+    """Open one connection per configured database on the async engines."""
+    for database_name in DATABASES:
+        try:
+            async with async_connect(database_name):
+                pass
+            print(f"Async connection pool warmed up for database '{database_name}'")
+        except Exception as e:
+            print(f"Warning: could not warm up async pool for '{database_name}': {str(e)}")
+
+
+async def dispose_async_engines() -> None:
+    """Close all pooled async connections and clear the async registry."""
+    engines = list(_async_engines.values())
+    _async_engines.clear()
+    _async_pool_metrics.clear()
+    for engine in engines:
+        await engine.dispose()
+
+
+def dispose_engines() -> None:
+    """Close all pooled connections and clear the registry."""
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _pool_metrics.clear()
+
+
+def get_pool_metrics() -> dict:
+    """Return pool checkout and wait metrics for every registered engine."""
+    metrics = {
+        name: _pool_metrics[name].snapshot(engine)
+        for name, engine in list(_engines.items())
+    }
+    for name, engine in list(_async_engines.items()):
+        metrics[f"{name}:async"] = _async_pool_metrics[name].snapshot(engine.sync_engine)
+    return metrics
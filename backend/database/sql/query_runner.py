@@ -0,0 +1,123 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing import List, Optional
+from sqlglot import exp
+import sqlglot
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import sys
+import os
+
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "1000"))
+SQL_MAX_RESULT_BYTES = int(os.getenv("SQL_MAX_RESULT_BYTES", str(4 * 1024 * 1024)))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "500"))
+
+# Generated SQL targets Postgres (the result cache is versioned by pg_stat_user_tables)
+SQL_DIALECT = "postgres"
+
+# Page tokens carry the SQL to resume, so they are signed to stop clients from
+# smuggling arbitrary statements through them. Without a configured secret the
+# tokens are only valid for the lifetime of this process.
+_PAGE_TOKEN_SECRET = os.getenv("PAGE_TOKEN_SECRET", "").encode() or secrets.token_bytes(32)
+
+
+def estimate_row_bytes(row: tuple) -> int:
+    """Approximate in-memory size of a fetched row."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class BoundedResult:
+    """At most one page of a query result, plus where the next page starts."""
+
+    def __init__(self, columns: List[str], rows: List[tuple], offset: int, truncated: bool, size: int):
+        self.columns = columns
+        self.rows = rows
+        self.offset = offset
+        self.truncated = truncated
+        self.size = size
+
+    @property
+    def next_offset(self) -> Optional[int]:
+        return self.offset + len(self.rows) if self.truncated else None
+
+
+def _parse_query(sql_query: str) -> Optional[exp.Expression]:
+    try:
+        return sqlglot.parse_one(sql_query, read=SQL_DIALECT)
+    except sqlglot.errors.SqlglotError:
+        return None
+
+
+def paged_statement(sql_query: str, offset: int, max_rows: int) -> str:
+    """
+    Wrap a read-only query so it resumes at a row offset (one extra row detects truncation).
+
+    An offset only continues where the previous page stopped if every page sees the rows in
+    the same order. A query with its own ORDER BY keeps it, and gets LIMIT and OFFSET appended
+    directly unless it has its own. Any other query is ordered by its whole row, on the first page
+    too, so that all pages agree. The query goes on lines of its own so a trailing -- comment
+    cannot swallow what follows it.
+    """
+    sql_query = sql_query.strip().rstrip(";")
+    query = _parse_query(sql_query)
+    ordered = query is not None and query.args.get("order") is not None
+    page = f"LIMIT {int(max_rows) + 1} OFFSET {int(offset)}"
+    if ordered:
+        if offset <= 0:
+            return sql_query
+        if isinstance(query, exp.Query) and not query.args.get("limit") and not query.args.get("offset"):
+            return f"{sql_query}\n{page}"
+        return f"SELECT * FROM (\n{sql_query}\n) AS paged_result {page}"
+    statement = f"SELECT * FROM (\n{sql_query}\n) AS paged_result ORDER BY paged_result::text"
+    return statement if offset <= 0 else f"{statement} {page}"
+
+
+async def fetch_bounded(connection: AsyncConnection, sql_query: str, offset: int = 0,
+                        max_rows: int = SQL_MAX_ROWS, max_bytes: int = SQL_MAX_RESULT_BYTES) -> BoundedResult:
+    """
+    Read a result through a server-side cursor, stopping at a row cap or byte budget.
+
+    Rows are pulled from the cursor in SQL_FETCH_SIZE batches, so memory use is bounded
+    by the page size rather than by the size of the full result set.
+    """
+    result = await connection.stream(text(paged_statement(sql_query, offset, max_rows)))
+    columns = list(result.keys())
+    rows: List[tuple] = []
+    size = 0
+    truncated = False
+    try:
+        async for partition in result.partitions(SQL_FETCH_SIZE):
+            for row in partition:
+                if len(rows) >= max_rows or size >= max_bytes:
+                    truncated = True
+                    break
+                row = tuple(row)
+                rows.append(row)
+                size += estimate_row_bytes(row)
+            if truncated:
+                break
+    finally:
+        await result.close()
+    return BoundedResult(columns, rows, offset, truncated, size)
+
+
+def encode_page_token(target_db: str, sql_query: str, offset: int) -> str:
+    payload = json.dumps({"db": target_db, "sql": sql_query, "offset": offset}, separators=(",", ":")).encode()
+    signature = hmac.new(_PAGE_TOKEN_SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(signature + payload).decode()
+
+
+def decode_page_token(token: str) -> dict:
+    """Return {"db", "sql", "offset"} from a page token, or raise ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode())
+    except Exception:
+        raise ValueError("Malformed page token")
+    signature, payload = raw[:32], raw[32:]
+    expected = hmac.new(_PAGE_TOKEN_SECRET, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise ValueError("Invalid or expired page token")
+    return json.loads(payload)
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlglot import exp
+import sqlglot
+import threading
+import os
+from backend.database.sql.query_runner import SQL_DIALECT, BoundedResult
+
+RESULT_CACHE_BYTES = int(os.getenv("SQL_RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Results larger than this share of the budget are not worth evicting everything else for.
+MAX_ENTRY_FRACTION = 0.25
+
+# Any of these inside a statement makes it a write, wherever it appears (e.g. a DELETE in a CTE)
+_WRITE_EXPRESSIONS = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Into, exp.Create, exp.Drop, exp.Alter, exp.Command)
+
+# pg_stat_user_tables counters move on every insert/update/delete, including
+# writes made by other processes. They are flushed by Postgres with a short
+# delay, so the in-process write counter covers writes made through this API.
+TABLE_MODIFICATIONS_QUERY = text("""
+    SELECT relname, n_tup_ins + n_tup_upd + n_tup_del
+    FROM pg_stat_user_tables
+    WHERE relname IN :tables
+""").bindparams(bindparam("tables", expanding=True))
+
+
+def normalize_sql(sql_query: str) -> str:
+    """
+    Drop comments, trailing semicolons and formatting by regenerating the SQL from its parse
+    tree, so string literals stay intact. SQL that does not parse is only stripped.
+    """
+    statements = parse_statements(sql_query)
+    if statements is None:
+        return sql_query.strip()
+    return ";\n".join(statement.sql(dialect=SQL_DIALECT, comments=False) for statement in statements)
+
+
+def parse_statements(sql_query: str) -> Optional[List[exp.Expression]]:
+    """The parsed statements, or None when the SQL cannot be parsed."""
+    try:
+        statements = sqlglot.parse(sql_query, read=SQL_DIALECT)
+    except sqlglot.errors.SqlglotError:
+        return None
+    statements = [statement for statement in statements if statement is not None]
+    return statements or None
+
+
+def is_read_only(sql_query: str) -> bool:
+    """True for a single SELECT (or WITH ... SELECT) statement that writes nothing."""
+    statements = parse_statements(sql_query)
+    if statements is None:
+        # Unparseable: only trust a lone statement that starts like a query
+        normalized = sql_query.strip().rstrip(";").lower()
+        return normalized.startswith(("select", "with")) and ";" not in normalized
+    statement = statements[0]
+    return (
+        len(statements) == 1
+        and isinstance(statement, exp.Query)
+        and statement.find(*_WRITE_EXPRESSIONS) is None
+    )
+
+
+def referenced_tables(sql_query: str, known_tables: Iterable[str]) -> Optional[List[str]]:
+    """
+    Return every table a statement reads from or writes to: comma lists, joins, subqueries
+    and CTE bodies included.
+
+    Returns None when that cannot be said with confidence, i.e. the SQL does not parse or
+    names a relation that is not a known table (a view, another schema's table, a table
+    function), since writes to whatever lies behind it would go unnoticed.
+    """
+    statements = parse_statements(sql_query)
+    if statements is None:
+        return None
+    known = {table.lower() for table in known_tables}
+    found = set()
+    for statement in statements:
+        ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+        for table in statement.find_all(exp.Table):
+            name = table.name.lower()
+            if not name or (not table.db and name in ctes):
+                continue
+            if name not in known:
+                return None
+            found.add(name)
+    return sorted(found)
+
+
+class CachedResult:
+    def __init__(self, result: BoundedResult, version_stamp: Tuple):
+        self.result = result
+        self.version_stamp = version_stamp
+        self.size = result.size
+
+
+class ResultCache:
+    """Byte-budgeted LRU cache of SQL results, invalidated by per-table version stamps."""
+    _instance: Optional["ResultCache"] = None
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], CachedResult]" = OrderedDict()
+        self._write_counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def get_instance(cls) -> "ResultCache":
+        if cls._instance is None:
+            cls._instance = ResultCache()
+        return cls._instance
+
+    async def version_stamp(self, connection: AsyncConnection, target_db: str, tables: List[str]) -> Tuple:
+        """Combine local write counters with Postgres modification counters for each table."""
+        modifications: Dict[str, int] = {}
+        if tables:
+            result = await connection.execute(TABLE_MODIFICATIONS_QUERY, {"tables": tables})
+            rows = result.fetchall()
+            modifications = {name: int(count or 0) for name, count in rows}
+        return tuple(
+            (table, self._write_counters.get((target_db, table), 0), modifications.get(table, 0))
+            for table in tables
+        )
+
+    def record_write(self, target_db: str, tables: Optional[Iterable[str]]) -> None:
+        """
+        Bump the local version of tables written through this process. With tables None
+        (the statement could not be analysed) every cached result of the database is dropped.
+        """
+        with self._lock:
+            if tables is None:
+                for key in [key for key in self._entries if key[0] == target_db]:
+                    self._remove(key)
+                    self.invalidations += 1
+                return
+            for table in tables:
+                key = (target_db, table)
+                self._write_counters[key] = self._write_counters.get(key, 0) + 1
+
+    def get(self, target_db: str, sql_query: str, version_stamp: Tuple) -> Optional[BoundedResult]:
+        key = (target_db, normalize_sql(sql_query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version_stamp != version_stamp:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def put(self, target_db: str, sql_query: str, version_stamp: Tuple, result: BoundedResult) -> None:
+        """Cache the first page of a result."""
+        if result.size > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        key = (target_db, normalize_sql(sql_query))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            entry = CachedResult(result, version_stamp)
+            self._entries[key] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
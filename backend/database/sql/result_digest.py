@@ -0,0 +1,203 @@
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing import Any, Callable, List, Optional
+import pandas as pd
+import os
+from backend.database.sql.result_format import ColumnInfo, ColumnarResult
+
+# Results with more rows than this reach the explanation prompt as a digest, not as rows
+RESULT_DIGEST_MIN_ROWS = int(os.getenv("RESULT_DIGEST_MIN_ROWS", "200"))
+RESULT_DIGEST_TOP_VALUES = int(os.getenv("RESULT_DIGEST_TOP_VALUES", "5"))
+RESULT_DIGEST_SAMPLE_ROWS = int(os.getenv("RESULT_DIGEST_SAMPLE_ROWS", "5"))
+
+_NUMERIC_TYPES = {"integer", "float", "decimal"}
+_TEMPORAL_TYPES = {"timestamp", "date"}
+_TEXT_TYPES = {"json", "binary"}
+
+
+class ColumnTotals(BaseModel):
+    """Aggregates of one column over the full result, computed by the database."""
+    name: str
+    values: int
+    minimum: Any = None
+    maximum: Any = None
+    mean: Optional[float] = None
+    std: Optional[float] = None
+
+
+class ResultTotals(BaseModel):
+    """Row count and per-column aggregates of a full result, of which only a page was fetched."""
+    row_count: int
+    columns: List[ColumnTotals]
+
+
+def needs_digest(row_count: int, truncated: bool) -> bool:
+    """Large results, and any result cut short by the row or byte cap, are explained from a digest."""
+    return truncated or row_count > RESULT_DIGEST_MIN_ROWS
+
+
+def _aggregates(column: ColumnInfo) -> List[str]:
+    if column.type in _NUMERIC_TYPES:
+        return ["MIN", "MAX", "AVG", "STDDEV_SAMP"]
+    if column.type in _TEMPORAL_TYPES:
+        return ["MIN", "MAX"]
+    return []
+
+
+def aggregate_statement(sql_query: str, columns: List[ColumnInfo], quote: Callable[[str], str]) -> str:
+    """One statement computing the row count and each column's aggregates over the whole query."""
+    parts = ["COUNT(*)"]
+    for column in columns:
+        name = quote(column.name)
+        parts.append(f"COUNT({name})")
+        parts.extend(f"{aggregate}({name})" for aggregate in _aggregates(column))
+    # The query gets lines of its own so a trailing -- comment cannot swallow the closing parenthesis
+    return f"SELECT {', '.join(parts)} FROM (\n{sql_query.strip().rstrip(';')}\n) AS digest_source"
+
+
+async def aggregate_result(connection: AsyncConnection, sql_query: str, columns: List[ColumnInfo]) -> ResultTotals:
+    """
+    Run aggregate_statement for a read-only query. This scans the full result once more
+    but returns a single row, so a truncated page can still be described as a whole.
+    """
+    statement = aggregate_statement(sql_query, columns, connection.dialect.identifier_preparer.quote)
+    row = list((await connection.execute(text(statement))).one())
+    row_count = int(row.pop(0))
+    totals = []
+    for column in columns:
+        values = int(row.pop(0))
+        found = {aggregate: row.pop(0) for aggregate in _aggregates(column)}
+        totals.append(ColumnTotals(
+            name=column.name,
+            values=values,
+            minimum=found.get("MIN"),
+            maximum=found.get("MAX"),
+            mean=None if found.get("AVG") is None else float(found["AVG"]),
+            std=None if found.get("STDDEV_SAMP") is None else float(found["STDDEV_SAMP"]),
+        ))
+    return ResultTotals(row_count=row_count, columns=totals)
+
+
+def _number(value: Any) -> str:
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+
+def _describe_numeric(values: pd.Series) -> str:
+    numbers = pd.to_numeric(values, errors="coerce").dropna()
+    if numbers.empty:
+        return "no values"
+    return (f"min {_number(numbers.min())}, max {_number(numbers.max())}, mean {_number(float(numbers.mean()))}, "
+            f"std {_number(float(numbers.std())) if len(numbers) > 1 else '0'}, {_describe_quartiles(numbers)}")
+
+
+def _describe_quartiles(values: pd.Series) -> str:
+    numbers = pd.to_numeric(values, errors="coerce").dropna()
+    if numbers.empty:
+        return ""
+    q1, median, q3 = numbers.quantile([0.25, 0.5, 0.75]).tolist()
+    return f"quartiles {_number(q1)} / {_number(median)} / {_number(q3)}"
+
+
+def _describe_temporal(values: pd.Series, dates: bool) -> str:
+    times = pd.to_datetime(values, errors="coerce")
+    if times.isna().any():
+        # Naive and aware timestamps mixed in one column only compare once all are in UTC
+        times = pd.to_datetime(values, errors="coerce", utc=True)
+    times = times.dropna()
+    if times.empty:
+        return "no values"
+    return _describe_range(times.min(), times.max(), dates)
+
+
+def _describe_range(first: Any, last: Any, dates: bool) -> str:
+    first, last = pd.Timestamp(first), pd.Timestamp(last)
+    if dates:
+        return f"range {first.date()} .. {last.date()} ({(last - first).days} days)"
+    return f"range {first} .. {last} (span {last - first})"
+
+
+def _describe_categorical(values: pd.Series, top_k: int) -> str:
+    counts = values.value_counts()
+    top = ", ".join(f"{value!r} ({count})" for value, count in counts.head(top_k).items())
+    return f"{len(counts)} distinct; top: {top}"
+
+
+def _describe_page(column: ColumnInfo, values: pd.Series, top_k: int) -> str:
+    if column.type in _NUMERIC_TYPES:
+        return _describe_numeric(values)
+    if column.type in _TEMPORAL_TYPES:
+        return _describe_temporal(values, dates=column.type == "date")
+    if column.type in _TEXT_TYPES:
+        # dicts and lists are unhashable; count their text instead
+        return _describe_categorical(values.astype(str), top_k)
+    return _describe_categorical(values, top_k)
+
+
+def _describe_totals(column: ColumnInfo, totals: ColumnTotals, row_count: int) -> str:
+    summary = f"- {column.name} ({column.type}): {totals.values} values, {row_count - totals.values} null"
+    if totals.minimum is None:
+        return summary
+    if column.type in _TEMPORAL_TYPES:
+        return f"{summary}; {_describe_range(totals.minimum, totals.maximum, dates=column.type == 'date')}"
+    detail = f"min {_number(totals.minimum)}, max {_number(totals.maximum)}"
+    if totals.mean is not None:
+        detail += f", mean {_number(totals.mean)}"
+    if totals.std is not None:
+        detail += f", std {_number(totals.std)}"
+    return f"{summary}; {detail}"
+
+
+def digest_result(result: ColumnarResult, truncated: bool = False, totals: Optional[ResultTotals] = None,
+                  top_k: int = RESULT_DIGEST_TOP_VALUES, sample_rows: int = RESULT_DIGEST_SAMPLE_ROWS) -> str:
+    """
+    Summarize a result set for an LLM prompt in a size independent of the row count.
+
+    Each column gets its type, value and null counts plus, by type: min/max/mean/std and
+    quartiles for numbers, the time range for dates and timestamps, and the most frequent
+    values for everything else. A few rows spread evenly over the result follow.
+
+    When the result was truncated, the digest says the fetched rows are only the first part
+    of it. With totals (see aggregate_result) the counts, min/max, mean and std describe the
+    full result, and only quartiles, top values and sample rows come from the fetched rows.
+    """
+    rows = result.row_count
+    columns = len(result.columns)
+    if not truncated:
+        lines = [f"Digest of {rows} rows x {columns} columns (summary statistics, not the raw rows):"]
+    elif totals is not None:
+        lines = [f"Digest of a {totals.row_count}-row result x {columns} columns (summary statistics, not the raw rows). "
+                 f"Counts, min/max, mean and std cover every row; quartiles, top values and sample rows "
+                 f"cover only the first {rows} rows:"]
+    else:
+        lines = [f"Digest of the first {rows} rows of a larger result x {columns} columns. "
+                 f"The full result was not read, so these statistics describe the first {rows} rows only:"]
+
+    for i, (column, column_values) in enumerate(zip(result.columns, result.values)):
+        values = pd.Series(column_values, dtype=object).dropna()
+        if totals is not None:
+            line = _describe_totals(column, totals.columns[i], totals.row_count)
+            if column.type in _NUMERIC_TYPES:
+                page_detail = _describe_quartiles(values)
+            elif column.type in _TEMPORAL_TYPES or values.empty:
+                page_detail = ""
+            else:
+                page_detail = _describe_page(column, values, top_k)
+            lines.append(f"{line}; {page_detail} (first {rows} rows)" if page_detail else line)
+            continue
+        summary = f"- {column.name} ({column.type}): {len(values)} values, {rows - len(values)} null"
+        lines.append(f"{summary}; {_describe_page(column, values, top_k)}" if not values.empty else summary)
+
+    if sample_rows and rows:
+        picked = sorted(set(
+            round(i * (rows - 1) / max(sample_rows - 1, 1)) for i in range(min(sample_rows, rows))
+        ))
+        sample = ColumnarResult(
+            columns=result.columns,
+            values=[[column[row] for row in picked] for column in result.values],
+            row_count=len(picked),
+        )
+        scope = f"the first {rows} rows" if truncated else f"{rows}"
+        lines.append(f"Representative rows ({len(picked)} of {scope}, evenly spaced):")
+        lines.append(sample.to_text())
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Sequence
+import json
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; JSON columns always work.
+    pa = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Checked in order: bool before int because bool is a subclass of int,
+# datetime before date for the same reason.
+_PYTHON_TYPES = [
+    (bool, "boolean"),
+    (int, "integer"),
+    (float, "float"),
+    (Decimal, "decimal"),
+    (datetime, "timestamp"),
+    (date, "date"),
+    (time, "time"),
+    (str, "string"),
+    (bytes, "binary"),
+]
+
+
+class ColumnInfo(BaseModel):
+    name: str
+    type: str
+
+
+class ColumnarResult(BaseModel):
+    """A query result as typed, column-oriented values (values[i] holds column i)."""
+    columns: List[ColumnInfo]
+    values: List[List[Any]]
+    row_count: int
+
+    def rows(self) -> List[tuple]:
+        return list(zip(*self.values)) if self.values else []
+
+    def to_text(self, max_rows: Optional[int] = None) -> str:
+        """Render as a pipe-separated table for LLM prompts."""
+        rows = self.rows()
+        if max_rows is not None:
+            rows = rows[:max_rows]
+        lines = [" | ".join(column.name for column in self.columns)]
+        lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in rows)
+        return "\n".join(lines)
+
+
+def infer_column_type(values: Sequence[Any]) -> str:
+    """Name the type of the first non-null value in a column."""
+    for value in values:
+        if value is None:
+            continue
+        for python_type, name in _PYTHON_TYPES:
+            if isinstance(value, python_type):
+                return name
+        return "json" if isinstance(value, (dict, list)) else "string"
+    return "null"
+
+
+def to_columnar(columns: List[str], rows: List[tuple]) -> ColumnarResult:
+    """Transpose fetched rows into typed columns."""
+    values = [list(column) for column in zip(*rows)] if rows else [[] for _ in columns]
+    infos = []
+    for name, column in zip(columns, values):
+        column_type = infer_column_type(column)
+        if column_type == "decimal":
+            # JSON has no decimal type; NUMERIC aggregates are far more useful as numbers than strings.
+            column[:] = [None if value is None else float(value) for value in column]
+        infos.append(ColumnInfo(name=name, type=column_type))
+    return ColumnarResult(columns=infos, values=values, row_count=len(rows))
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def to_arrow_ipc(result: ColumnarResult, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """Serialize a result as an Arrow IPC stream; `metadata` travels as JSON in the schema metadata."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    arrays = [pa.array(column) for column in result.values]
+    table = pa.Table.from_arrays(arrays, names=[column.name for column in result.columns])
+    if metadata:
+        table = table.replace_schema_metadata({"response": json.dumps(metadata, default=str)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def wants_arrow(accept_header: Optional[str]) -> bool:
+    return bool(accept_header) and ARROW_STREAM_MEDIA_TYPE in accept_header and pa is not None
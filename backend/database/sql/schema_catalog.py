@@ -0,0 +1,201 @@
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+import os
+from backend.database.sql.database import get_engine
+from backend.prompt_budget import TokenCounter, truncate_to_tokens
+
+SAMPLE_ROWS_PER_TABLE = int(os.getenv("SCHEMA_SAMPLE_ROWS", "3"))
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "30"))
+MAX_COMMON_VALUES = 5
+
+# (column stats, sample rows) to include, most detailed first; a budgeted prompt uses
+# the first level that fits, so sample rows go before stats and stats before DDL.
+_DETAIL_LEVELS = [(True, True), (True, False), (False, False)]
+
+# A cheap fingerprint of the public schema: any added/dropped/altered column
+# or constraint changes the hash and invalidates the cached catalog.
+SCHEMA_VERSION_QUERY = text("""
+    SELECT md5(
+        coalesce((
+            SELECT string_agg(table_name || '.' || column_name || ':' || data_type || ':' || is_nullable,
+                              ',' ORDER BY table_name, ordinal_position)
+            FROM information_schema.columns
+            WHERE table_schema = 'public'
+        ), '') ||
+        coalesce((
+            SELECT string_agg(table_name || '.' || constraint_name || ':' || constraint_type,
+                              ',' ORDER BY table_name, constraint_name)
+            FROM information_schema.table_constraints
+            WHERE table_schema = 'public'
+        ), '')
+    )
+""")
+
+COLUMN_STATS_QUERY = text("""
+    SELECT tablename, attname, null_frac, n_distinct, most_common_vals::text
+    FROM pg_stats
+    WHERE schemaname = 'public'
+""")
+
+
+class TableInfo:
+    """Precomputed description of one table for the SQL agent prompt."""
+
+    def __init__(self, name: str, ddl: str, foreign_keys: List[str], column_stats: List[str],
+                 columns: List[str], sample_rows: List[tuple]):
+        self.name = name
+        self.ddl = ddl
+        self.foreign_keys = foreign_keys
+        self.column_stats = column_stats
+        self.columns = columns
+        self.sample_rows = sample_rows
+
+    def to_prompt(self, column_stats: bool = True, sample_rows: bool = True) -> str:
+        lines = [self.ddl.strip()]
+        if self.foreign_keys:
+            lines.append("Foreign keys: " + "; ".join(self.foreign_keys))
+        if column_stats and self.column_stats:
+            lines.append("Column stats: " + "; ".join(self.column_stats))
+        if sample_rows and self.sample_rows:
+            lines.append(f"Sample rows from {self.name}:")
+            lines.append(" | ".join(self.columns))
+            lines.extend(" | ".join(str(value) for value in row) for row in self.sample_rows)
+        return "\n".join(lines)
+
+
+class SchemaCatalog:
+    """DDL, relationships, sample rows and column statistics for a database."""
+
+    def __init__(self, version: str, tables: Dict[str, TableInfo]):
+        self.version = version
+        self.tables = tables
+        self.built_at = time.time()
+        self._prompts: Dict[Tuple[bool, bool], str] = {}
+
+    @property
+    def table_names(self) -> List[str]:
+        return list(self.tables)
+
+    def _render(self, column_stats: bool, sample_rows: bool) -> str:
+        key = (column_stats, sample_rows)
+        if key not in self._prompts:
+            self._prompts[key] = "\n\n".join(
+                table.to_prompt(column_stats, sample_rows) for table in self.tables.values()
+            )
+        return self._prompts[key]
+
+    def to_prompt(self, max_tokens: Optional[int] = None, count_tokens: Optional[TokenCounter] = None) -> str:
+        """
+        The catalog as prompt text. Within a token budget, sample rows are left out first,
+        then column stats, and DDL that still does not fit is truncated.
+        """
+        if max_tokens is None or count_tokens is None:
+            return self._render(True, True)
+        for column_stats, sample_rows in _DETAIL_LEVELS:
+            prompt = self._render(column_stats, sample_rows)
+            if count_tokens(prompt) <= max_tokens:
+                return prompt
+        return truncate_to_tokens(prompt, max_tokens, count_tokens)
+
+
+def get_schema_version(engine: Engine) -> str:
+    """Return the current schema fingerprint for a database."""
+    with engine.connect() as connection:
+        return connection.execute(SCHEMA_VERSION_QUERY).scalar() or ""
+
+
+def _load_column_stats(engine: Engine) -> Dict[str, List[str]]:
+    """Summarize pg_stats per table (empty until the table has been ANALYZEd)."""
+    stats: Dict[str, List[str]] = {}
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(COLUMN_STATS_QUERY).fetchall()
+    except Exception as e:
+        print(f"Warning: could not read pg_stats: {str(e)}")
+        return stats
+
+    for table_name, column, null_frac, n_distinct, common_values in rows:
+        summary = f"{column} (null_frac={null_frac:.2f}, n_distinct={n_distinct:g}"
+        if common_values:
+            values = common_values.strip("{}").split(",")[:MAX_COMMON_VALUES]
+            summary += f", common={','.join(values)}"
+        stats.setdefault(table_name, []).append(summary + ")")
+    return stats
+
+
+def build_schema_catalog(engine: Engine, version: Optional[str] = None) -> SchemaCatalog:
+    """Reflect the schema once and collect everything the agent would otherwise discover."""
+    if version is None:
+        version = get_schema_version(engine)
+
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    inspector = inspect(engine)
+    column_stats = _load_column_stats(engine)
+
+    tables: Dict[str, TableInfo] = {}
+    with engine.connect() as connection:
+        for table in metadata.sorted_tables:
+            foreign_keys = [
+                f"{', '.join(fk['constrained_columns'])} -> "
+                f"{fk['referred_table']}.{', '.join(fk['referred_columns'])}"
+                for fk in inspector.get_foreign_keys(table.name)
+            ]
+            sample_rows = []
+            if SAMPLE_ROWS_PER_TABLE > 0:
+                sample_rows = connection.execute(
+                    table.select().limit(SAMPLE_ROWS_PER_TABLE)
+                ).fetchall()
+            tables[table.name] = TableInfo(
+                name=table.name,
+                ddl=str(CreateTable(table).compile(engine)),
+                foreign_keys=foreign_keys,
+                column_stats=column_stats.get(table.name, []),
+                columns=[column.name for column in table.columns],
+                sample_rows=[tuple(row) for row in sample_rows],
+            )
+
+    return SchemaCatalog(version, tables)
+
+
+class SchemaCatalogRegistry:
+    """Caches one catalog per database, rebuilt when the schema version changes."""
+    _catalogs: Dict[str, SchemaCatalog] = {}
+    _checked_at: Dict[str, float] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, database_name: str = "default") -> SchemaCatalog:
+        """Return the catalog, re-checking the schema version at most every SCHEMA_CHECK_INTERVAL seconds."""
+        catalog = cls._catalogs.get(database_name)
+        now = time.monotonic()
+        if catalog is not None and now - cls._checked_at.get(database_name, 0) < SCHEMA_CHECK_INTERVAL:
+            return catalog
+
+        with cls._lock:
+            catalog = cls._catalogs.get(database_name)
+            if catalog is not None and now - cls._checked_at.get(database_name, 0) < SCHEMA_CHECK_INTERVAL:
+                return catalog
+
+            engine = get_engine(database_name)
+            version = get_schema_version(engine)
+            if catalog is None or catalog.version != version:
+                catalog = build_schema_catalog(engine, version)
+                cls._catalogs[database_name] = catalog
+                print(f"Schema catalog built for '{database_name}' ({len(catalog.tables)} tables)")
+            cls._checked_at[database_name] = now
+            return catalog
+
+    @classmethod
+    def invalidate(cls, database_name: Optional[str] = None) -> None:
+        with cls._lock:
+            if database_name is None:
+                cls._catalogs.clear()
+                cls._checked_at.clear()
+            else:
+                cls._catalogs.pop(database_name, None)
+                cls._checked_at.pop(database_name, None)
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Iterator
+import threading
+import asyncio
+import os
+
+# Blocking work is kept off the event loop in bounded thread pools, one per
+# kind of work, so a burst of LLM calls cannot starve embedding or catalog work.
+LLM_EXECUTOR_WORKERS = int(os.getenv("LLM_EXECUTOR_WORKERS", "8"))
+ENCODER_EXECUTOR_WORKERS = int(os.getenv("ENCODER_EXECUTOR_WORKERS", "2"))
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "4"))
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_EXECUTOR_WORKERS, thread_name_prefix="llm")
+encoder_executor = ThreadPoolExecutor(max_workers=ENCODER_EXECUTOR_WORKERS, thread_name_prefix="encoder")
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="blocking")
+
+
+async def _run(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+async def run_llm(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run an LLM call (agent run, explanation) without blocking the event loop."""
+    return await _run(llm_executor, fn, *args, **kwargs)
+
+
+async def run_encoder(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run sentence-encoder and FAISS work without blocking the event loop."""
+    return await _run(encoder_executor, fn, *args, **kwargs)
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run other blocking I/O, such as schema reflection on the sync engine."""
+    return await _run(blocking_executor, fn, *args, **kwargs)
+
+
+async def stream_llm(fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+    """
+    Iterate a blocking generator (e.g. LLM token streaming) from async code.
+
+    The generator runs on the LLM executor and hands items to the event loop
+    as they are produced. If the consumer stops early (client disconnect), the
+    producer stops at its next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in fn(*args, **kwargs):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+            return
+        loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    producer = loop.run_in_executor(llm_executor, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stopped.set()
+        await asyncio.shield(producer)
+
+
+def shutdown_executors() -> None:
+    for executor in (llm_executor, encoder_executor, blocking_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,185 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+import threading
+import queue
+import time
+import os
+from langchain.llms import LlamaCpp
+from langchain_openai import ChatOpenAI
+
+# Providers whose client objects are thin HTTP wrappers and can be shared by
+# several in-flight calls. Local models get one loaded instance per slot.
+SHARED_CLIENT_PROVIDERS = {"openai"}
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_ACQUIRE_TIMEOUT", "120"))
+
+LOCAL_N_CTX = 2048
+LOCAL_MAX_TOKENS = 1024
+
+# Token budget for explanation prompts; 0 derives it from the provider's context window
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "0"))
+# The local model must fit prompt and completion into n_ctx; remote models have room to spare,
+# but a bounded prompt still bounds prefill time
+_PROMPT_TOKEN_LIMITS = {
+    "local": LOCAL_N_CTX - LOCAL_MAX_TOKENS,
+    "openai": 16384,
+}
+
+
+def load_llm(provider: str):
+    """Build the LLM client for a provider. Called once per pool slot."""
+    if provider == "openai":
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is required when using OpenAI")
+
+        return ChatOpenAI(
+            api_key=api_key,
+            temperature=0.1,
+            model="gpt-4o-mini"
+        )
+
+    elif provider == "local":
+        return LlamaCpp(
+            model_path="./models/llama-2-7b-chat.gguf",
+            temperature=0.1,
+            max_tokens=LOCAL_MAX_TOKENS,
+            top_p=0.9,
+            n_ctx=LOCAL_N_CTX,
+            n_gpu_layers=1
+        )
+
+    else:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when the wait queue for a model is full or the wait timed out."""
+
+
+class ModelPool:
+    """A bounded pool of loaded instances of one model."""
+
+    def __init__(self, name: str, factory: Callable[[], Any], slots: int, shared_client: bool):
+        self.name = name
+        self.slots = slots
+        started = time.perf_counter()
+        if shared_client:
+            client = factory()
+            instances = [client] * slots
+        else:
+            instances = [factory() for _ in range(slots)]
+        self.load_seconds = time.perf_counter() - started
+
+        self._available: "queue.Queue[Any]" = queue.Queue()
+        for instance in instances:
+            self._available.put(instance)
+
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._total_wait_seconds = 0.0
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None):
+        """Borrow an instance, waiting in FIFO order if all slots are busy."""
+        with self._lock:
+            if self._waiting >= LLM_MAX_QUEUE:
+                raise LLMBusyError(f"Too many requests waiting for model '{self.name}'")
+            self._waiting += 1
+
+        started = time.perf_counter()
+        try:
+            llm = self._available.get(timeout=timeout if timeout is not None else LLM_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise LLMBusyError(f"Timed out waiting for model '{self.name}'")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            self._in_flight += 1
+            self._total_wait_seconds += time.perf_counter() - started
+        try:
+            yield llm
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+            self._available.put(llm)
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self._completed + self._in_flight
+            return {
+                "slots": self.slots,
+                "load_seconds": round(self.load_seconds, 3),
+                "queue_depth": self._waiting,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "avg_wait_ms": (self._total_wait_seconds / served * 1000) if served else 0.0,
+            }
+
+
+class LLMManager:
+    """Process-wide registry of model pools, loaded once at startup."""
+    _pools: Dict[str, ModelPool] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def default_provider(cls) -> str:
+        return os.getenv("LLM_PROVIDER", "local").lower()
+
+    @classmethod
+    def initialize(cls, providers: Optional[list] = None) -> None:
+        """Load every configured model so the first request does not pay for it."""
+        for provider in providers or [cls.default_provider()]:
+            cls.get_pool(provider)
+
+    @classmethod
+    def get_pool(cls, provider: Optional[str] = None) -> ModelPool:
+        provider = (provider or cls.default_provider()).lower()
+        pool = cls._pools.get(provider)
+        if pool is not None:
+            return pool
+
+        with cls._lock:
+            pool = cls._pools.get(provider)
+            if pool is None:
+                shared_client = provider in SHARED_CLIENT_PROVIDERS
+                slots = LLM_MAX_CONCURRENCY if shared_client else LLM_POOL_SIZE
+                pool = ModelPool(provider, lambda: load_llm(provider), slots, shared_client)
+                cls._pools[provider] = pool
+                print(f"Loaded LLM '{provider}' with {slots} slot(s) in {pool.load_seconds:.2f}s")
+        return pool
+
+    @classmethod
+    @contextmanager
+    def acquire(cls, provider: Optional[str] = None, timeout: Optional[float] = None):
+        """Borrow an LLM instance for the duration of the block."""
+        with cls.get_pool(provider).acquire(timeout=timeout) as llm:
+            yield llm
+
+    @classmethod
+    def stream(cls, prompt: str, provider: Optional[str] = None) -> Iterator[str]:
+        """Yield the completion for a prompt token by token, holding one pooled instance."""
+        with cls.acquire(provider) as llm:
+            for chunk in llm.stream(prompt):
+                # Chat models yield message chunks, completion models yield strings.
+                yield getattr(chunk, "content", chunk)
+
+    @classmethod
+    def prompt_token_limit(cls, provider: Optional[str] = None) -> int:
+        """How many tokens an explanation prompt may use with this provider."""
+        if PROMPT_MAX_TOKENS > 0:
+            return PROMPT_MAX_TOKENS
+        provider = (provider or cls.default_provider()).lower()
+        return _PROMPT_TOKEN_LIMITS.get(provider, LOCAL_N_CTX - LOCAL_MAX_TOKENS)
+
+    @classmethod
+    def get_metrics(cls) -> dict:
+        return {name: pool.stats() for name, pool in list(cls._pools.items())}
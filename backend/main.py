@@ -1,15 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from motor.motor_asyncio import AsyncIOMotorClient
-from backend.database.sql.database import get_engine
-from backend.sql_agent import generate_sql_from_question, explain_query_execution
-from backend.rag_agent import explain_rag_results
+from backend.database.sql.database import (
+    get_engine, async_connect, warm_up_engines, warm_up_async_engines,
+    dispose_engines, dispose_async_engines, get_pool_metrics,
+)
+from backend.sql_agent import generate_sql_from_question, explain_query_execution, budget_explanation_prompt
+from backend.rag_agent import explain_rag_results, budget_rag_prompt
+from backend.prompt_budget import TrimmedSection
+from backend.llm_manager import LLMManager, LLMBusyError
+from backend.database.sql.schema_catalog import SchemaCatalogRegistry
+from backend.question_cache import QuestionCache
+from backend.executors import run_llm, run_encoder, run_blocking, stream_llm, shutdown_executors
+from backend.database.sql.result_cache import ResultCache, is_read_only, referenced_tables
+from backend.database.sql.query_runner import BoundedResult, fetch_bounded, encode_page_token, decode_page_token
+from backend.database.sql.result_format import ColumnarResult, ARROW_STREAM_MEDIA_TYPE, to_columnar, to_arrow_ipc, wants_arrow
+from backend.database.sql.result_digest import aggregate_result, digest_result, needs_digest
+from backend.pipeline import StageGraph, StageTiming
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text
 import os
-from typing import List
+import json
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from backend.database.nosql.repository.vector_repository import VectorRepository
-from backend.database.nosql.mock.battery_knowledge import BATTERY_KNOWLEDGE_DATA
 
 app = FastAPI(
     title="SQL-Based RAG Service",
@@ -17,43 +34,130 @@ app = FastAPI(
 )
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Initialize services on startup."""
-    # Initialize vector search
-    documents = [knowledge.model_dump() for knowledge in BATTERY_KNOWLEDGE_DATA]
-    VectorRepository.initialize(documents)
+    # Initialize vector search from the knowledge collection and keep it in sync
+    await VectorRepository.initialize_from_mongodb()
     print("Vector search initialized on startup")
 
+    # Open the shared connection pools before the first request arrives
+    warm_up_engines()
+    await warm_up_async_engines()
+
+    # Build the schema catalog up front so the first question skips reflection
+    try:
+        SchemaCatalogRegistry.get("default")
+    except Exception as e:
+        print(f"Warning: could not build schema catalog: {str(e)}")
+
+    # Load the configured LLM once; requests borrow it from the pool
+    LLMManager.initialize()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled resources on shutdown."""
+    await VectorRepository.shutdown()
+    await dispose_async_engines()
+    dispose_engines()
+    shutdown_executors()
+
 # MongoDB connection
 mongo_client = AsyncIOMotorClient(os.getenv("MONGO_URI"))
 mongo_db = mongo_client[os.getenv("MONGO_DB")]
 
+# Most questions one /rag_query/batch call may carry, and how many of them are
+# generating, executing and explaining SQL at any moment.
+RAG_BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "500"))
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+
 class QueryRequest(BaseModel):
     question: str
     target_db: str = "default"  # Optional: specify which database to target.
+    explain: bool = True  # False skips the LLM explanation and returns only the SQL and its result.
+
+class RAGQueryRequest(QueryRequest):
+    # Optional: restrict retrieval to one category and/or to documents carrying all these tags.
+    category: Optional[str] = None
+    tags: List[str] = []
+
+class RAGBatchRequest(BaseModel):
+    questions: List[str]
+    target_db: str = "default"
+    # Retrieval filters, applied to every question in the batch.
+    category: Optional[str] = None
+    tags: List[str] = []
+
+class SQLCacheInfo(BaseModel):
+    hit: bool
+    similarity: float
+    saved_llm_seconds: float
+    hit_rate: float
 
 class QueryResponse(BaseModel):
     question: str
     sql_query: str
-    result: str  # The query result as a string (for simplicity).
-    explanation: str
+    result: ColumnarResult
+    explanation: Optional[str] = None
+    sql_cache: Optional[SQLCacheInfo] = None
+    result_cached: bool = False
+    row_count: int = 0
+    truncated: bool = False  # True when the row cap or byte budget cut the result short.
+    next_page_token: Optional[str] = None
+    timings: Dict[str, StageTiming] = {}
+    prompt_trimmed: List[TrimmedSection] = []  # What the explanation prompt left out to fit the model.
 
 class RelevantDocument(BaseModel):
     title: str
-    content: str
+    content: str  # The matching passages, not necessarily the whole document.
     category: str
     tags: List[str]
     relevance_score: float
+    spans: List[Tuple[int, int]] = []  # Character ranges of `content` within the full document.
 
 class RAGResponse(BaseModel):
     question: str
     sql_query: str
-    sql_result: str
+    sql_result: ColumnarResult
     relevant_docs: List[RelevantDocument]
-    combined_explanation: str
+    combined_explanation: Optional[str] = None
+    sql_cache: Optional[SQLCacheInfo] = None
+    result_cached: bool = False
+    row_count: int = 0
+    truncated: bool = False
+    next_page_token: Optional[str] = None
+    timings: Dict[str, StageTiming] = {}
+    prompt_trimmed: List[TrimmedSection] = []
 
-@app.post("/query", response_model=QueryResponse)
-def process_query(request: QueryRequest):
+class GeneratedSQL(BaseModel):
+    sql_query: str
+    llm_output: str
+    sql_cache: Optional[SQLCacheInfo] = None
+    # Pending question-cache entry, stored once the SQL has executed cleanly.
+    _cache_store: Optional[tuple] = None
+
+class ExecutedSQL(BaseModel):
+    result: ColumnarResult
+    result_cached: bool = False
+    row_count: int = 0
+    truncated: bool = False
+    next_page_token: Optional[str] = None
+
+class Explanation(BaseModel):
+    text: Optional[str] = None  # None when the request opted out of the explanation.
+    prompt_trimmed: List[TrimmedSection] = []
+
+class PageRequest(BaseModel):
+    page_token: str
+
+class PageResponse(BaseModel):
+    sql_query: str
+    result: ColumnarResult
+    row_count: int
+    truncated: bool
+    next_page_token: Optional[str] = None
+
+async def generate_sql(request: QueryRequest) -> GeneratedSQL:
+    """Translate the question into SQL, reusing a cached translation when possible."""
     # Retrieve the SQLAlchemy engine for the given database.
     try:
         engine = get_engine(request.target_db)
@@ -63,85 +167,455 @@ def process_query(request: QueryRequest):
     # Use the engine's URL (wrapped as a string) for the SQL agent.
     db_url = str(engine.url)
 
+    # Reuse SQL already validated for the same (or a near-identical) question.
+    question_cache = QuestionCache.get_instance()
+    cache_lookup = None
+    try:
+        catalog = await run_blocking(SchemaCatalogRegistry.get, request.target_db)
+        cache_lookup = await run_encoder(question_cache.lookup, request.question, request.target_db, catalog.version)
+    except Exception as e:
+        print(f"Warning: question cache unavailable: {str(e)}")
+
+    if cache_lookup is not None and cache_lookup.hit:
+        return GeneratedSQL(
+            sql_query=cache_lookup.entry.sql_query,
+            llm_output=cache_lookup.entry.llm_output,
+            sql_cache=SQLCacheInfo(
+                hit=True,
+                similarity=cache_lookup.similarity,
+                saved_llm_seconds=cache_lookup.entry.llm_seconds,
+                hit_rate=question_cache.hit_rate,
+            ),
+        )
+
     # Generate the SQL query using LangChain's SQL agent.
     try:
-        sql_query, llm_output = generate_sql_from_question(request.question, db_url)
+        generation_started = time.perf_counter()
+        sql_query, llm_output = await run_llm(generate_sql_from_question, request.question, db_url, request.target_db)
+        generation_seconds = time.perf_counter() - generation_started
     except Exception as e:
         if isinstance(e, ValueError):
             raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, LLMBusyError):
+            raise HTTPException(status_code=503, detail=str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Error generating SQL: {str(e)}\nPlease try rephrasing your question."
         )
-    
-    # Execute the generated SQL query using SQLAlchemy.
+
+    generated = GeneratedSQL(sql_query=sql_query, llm_output=llm_output)
+    if cache_lookup is not None:
+        generated._cache_store = (cache_lookup, generation_seconds)
+        generated.sql_cache = SQLCacheInfo(
+            hit=False,
+            similarity=cache_lookup.similarity,
+            saved_llm_seconds=0.0,
+            hit_rate=question_cache.hit_rate,
+        )
+    return generated
+
+async def execute_sql(request: QueryRequest, generated: GeneratedSQL) -> ExecutedSQL:
+    """Execute the generated SQL, serving repeated reads from the result cache."""
+    sql_query = generated.sql_query
+    result_cache = ResultCache.get_instance()
     try:
-        with engine.connect() as connection:
-            result_proxy = connection.execute(text(sql_query))
-            # Fetch all results (for demonstration, convert to a string).
-            results = result_proxy.fetchall()
-            result_str = str(results)
+        catalog = await run_blocking(SchemaCatalogRegistry.get, request.target_db)
+        tables = referenced_tables(sql_query, catalog.table_names)
+    except Exception:
+        tables = None
+    # Only a single read whose every table is known can be cached and versioned
+    read_only = is_read_only(sql_query)
+    result_cached = False
+    try:
+        async with async_connect(request.target_db) as connection:
+            bounded = None
+            version_stamp = None
+            if read_only and tables:
+                version_stamp = await result_cache.version_stamp(connection, request.target_db, tables)
+                bounded = result_cache.get(request.target_db, sql_query, version_stamp)
+                result_cached = bounded is not None
+
+            if bounded is None and read_only:
+                # Stream through a server-side cursor, keeping at most one page in memory.
+                bounded = await fetch_bounded(connection, sql_query)
+                if version_stamp is not None:
+                    result_cache.put(request.target_db, sql_query, version_stamp, bounded)
+            elif bounded is None:
+                result_proxy = await connection.execute(text(sql_query))
+                rows = [tuple(row) for row in result_proxy.fetchall()] if result_proxy.returns_rows else []
+                bounded = BoundedResult(list(result_proxy.keys()) if result_proxy.returns_rows else [], rows, 0, False, 0)
+                result_cache.record_write(request.target_db, tables)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Error executing SQL: {str(e)}; Query: {sql_query}")
-    
-    # Use the Llama model to generate an explanation.
+
+    # Only read-only SQL that executed cleanly is worth reusing.
+    if generated._cache_store is not None and read_only:
+        cache_lookup, generation_seconds = generated._cache_store
+        QuestionCache.get_instance().store(cache_lookup, sql_query, generated.llm_output, generation_seconds)
+
+    return ExecutedSQL(
+        result=to_columnar(bounded.columns, bounded.rows),
+        result_cached=result_cached,
+        row_count=len(bounded.rows),
+        truncated=bounded.truncated,
+        next_page_token=(
+            encode_page_token(request.target_db, sql_query, bounded.next_offset)
+            if bounded.truncated else None
+        ),
+    )
+
+async def digest_sql_result(request: QueryRequest, generated: GeneratedSQL, executed: ExecutedSQL) -> Optional[str]:
+    """
+    Summarize a large or truncated result for the explanation prompt; None when its rows go in as they are.
+    A truncated result's counts and aggregates are computed by the database over the whole query.
+    """
+    if not needs_digest(executed.row_count, executed.truncated):
+        return None
+    totals = None
+    if executed.truncated:
+        try:
+            async with async_connect(request.target_db) as connection:
+                totals = await aggregate_result(connection, generated.sql_query, executed.result.columns)
+        except Exception as e:
+            # e.g. duplicate column names; the digest then says it covers the first page only
+            print(f"Warning: could not aggregate the full result: {str(e)}")
+    return await run_blocking(digest_result, executed.result, executed.truncated, totals)
+
+async def explain_sql(request: QueryRequest, generated: GeneratedSQL, executed: ExecutedSQL,
+                      digest: Optional[str]) -> Explanation:
+    """Use the Llama model to generate an explanation."""
     try:
-        explanation = explain_query_execution(request.question, llm_output, result_str)
+        answer, trimmed = await run_llm(
+            explain_query_execution, request.question, generated.llm_output, executed.result, digest
+        )
+        return Explanation(text=answer, prompt_trimmed=trimmed)
+    except Exception as e:
+        return Explanation(text=f"Failed to generate explanation: {str(e)}")
+
+async def retrieve_documents(request: RAGQueryRequest) -> List[RelevantDocument]:
+    """Search for relevant documents by text and vector similarity."""
+    try:
+        retriever = VectorRepository.get_retriever()
+        results = await retriever.search(request.question, k=3, category=request.category, tags=request.tags)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving relevant documents: {str(e)}"
+        )
+
+    return relevant_documents(results)
+
+async def retrieve_documents_batch(request: RAGBatchRequest) -> List[List[RelevantDocument]]:
+    """retrieve_documents for every question of a batch, sharing one encode pass and one vector search."""
+    try:
+        retriever = VectorRepository.get_retriever()
+        results = await retriever.search_batch(request.questions, k=3, category=request.category, tags=request.tags)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving relevant documents: {str(e)}"
+        )
+
+    return [relevant_documents(docs) for docs in results]
+
+def relevant_documents(results) -> List[RelevantDocument]:
+    return [
+        RelevantDocument(
+            title=doc["title"],
+            content=doc["content"],
+            category=doc["category"],
+            tags=doc["tags"],
+            relevance_score=doc["relevance_score"],
+            spans=doc.get("spans") or [],
+        )
+        for doc in results
+    ]
+
+async def explain_rag(request: QueryRequest, executed: ExecutedSQL, relevant_docs: List[RelevantDocument],
+                      digest: Optional[str]) -> Explanation:
+    """Generate combined explanation using both SQL results and relevant docs."""
+    try:
+        answer, trimmed = await run_llm(
+            explain_rag_results,
+            question=request.question,
+            sql_result=executed.result,
+            relevant_docs=relevant_docs,
+            digest=digest,
+        )
+        return Explanation(text=answer, prompt_trimmed=trimmed)
     except Exception as e:
-        explanation = f"Failed to generate explanation: {str(e)}"
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating combined explanation: {str(e)}"
+        )
 
-    return QueryResponse(
+def build_sql_stages(graph: StageGraph, request: QueryRequest) -> StageGraph:
+    """
+    Add the generate -> execute -> digest -> explain stages shared by the endpoints.
+    explain_sql only runs when it is a target of the run, e.g. not for /rag_query.
+    """
+    graph.add("generate_sql", lambda: generate_sql(request))
+    graph.add("execute_sql", lambda generate_sql: execute_sql(request, generate_sql), deps=["generate_sql"])
+    graph.add(
+        "digest_result",
+        lambda generate_sql, execute_sql: digest_sql_result(request, generate_sql, execute_sql),
+        deps=["generate_sql", "execute_sql"],
+    )
+    graph.add(
+        "explain_sql",
+        lambda generate_sql, execute_sql, digest_result: explain_sql(request, generate_sql, execute_sql, digest_result),
+        deps=["generate_sql", "execute_sql", "digest_result"],
+    )
+    return graph
+
+def negotiate_result(http_request: Request, response: BaseModel, result_field: str):
+    """Return Arrow IPC when the client asks for it, otherwise the JSON model."""
+    if not wants_arrow(http_request.headers.get("accept")):
+        return response
+    metadata = response.model_dump(mode="json", exclude={result_field})
+    return Response(
+        content=to_arrow_ipc(getattr(response, result_field), metadata),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+    )
+
+@app.post("/query", response_model=QueryResponse)
+async def process_query(request: QueryRequest, http_request: Request):
+    targets = ["explain_sql"] if request.explain else ["execute_sql"]
+    results, timings = await build_sql_stages(StageGraph(), request).run(targets)
+    generated, executed = results["generate_sql"], results["execute_sql"]
+    explanation = results.get("explain_sql", Explanation())
+
+    response = QueryResponse(
         question=request.question,
-        sql_query=sql_query,
-        result=result_str,
-        explanation=explanation,
+        sql_query=generated.sql_query,
+        result=executed.result,
+        explanation=explanation.text,
+        sql_cache=generated.sql_cache,
+        result_cached=executed.result_cached,
+        row_count=executed.row_count,
+        truncated=executed.truncated,
+        next_page_token=executed.next_page_token,
+        timings=timings,
+        prompt_trimmed=explanation.prompt_trimmed,
     )
+    return negotiate_result(http_request, response, "result")
 
 @app.post("/rag_query", response_model=RAGResponse)
-async def process_rag_query(request: QueryRequest):
+async def process_rag_query(request: RAGQueryRequest, http_request: Request):
     """
     Process a question using both SQL and document retrieval (RAG).
     1. Execute SQL query on structured data
-    2. Retrieve relevant documents from MongoDB
-    3. Combine results with an explanation
+    2. Retrieve relevant documents from MongoDB, concurrently with step 1
+    3. Combine results with an explanation (the SQL-only explanation stage is never run)
     """
-    # First, process SQL query (reuse existing logic)
-    sql_response = process_query(request)
+    graph = build_sql_stages(StageGraph(), request)
+    add_rag_stages(graph, request, lambda: retrieve_documents(request))
+    targets = ["explain_rag"] if request.explain else ["execute_sql", "retrieve_documents"]
+    results, timings = await graph.run(targets)
+    return negotiate_result(http_request, rag_response(request, results, timings), "sql_result")
 
-    # Then, search for relevant documents using vector similarity
+def add_rag_stages(graph: StageGraph, request: RAGQueryRequest,
+                   retrieve: Callable[[], Any]) -> StageGraph:
+    """Add retrieval, and the explanation combining it with the SQL result, to the SQL stages."""
+    graph.add("retrieve_documents", retrieve)
+    graph.add(
+        "explain_rag",
+        lambda execute_sql, retrieve_documents, digest_result: explain_rag(
+            request, execute_sql, retrieve_documents, digest_result
+        ),
+        deps=["execute_sql", "retrieve_documents", "digest_result"],
+    )
+    return graph
+
+def rag_response(request: RAGQueryRequest, results: Dict[str, Any], timings: Dict[str, StageTiming]) -> RAGResponse:
+    generated, executed = results["generate_sql"], results["execute_sql"]
+    explanation = results.get("explain_rag", Explanation())
+    return RAGResponse(
+        question=request.question,
+        sql_query=generated.sql_query,
+        sql_result=executed.result,
+        relevant_docs=results["retrieve_documents"],
+        combined_explanation=explanation.text,
+        sql_cache=generated.sql_cache,
+        result_cached=executed.result_cached,
+        row_count=executed.row_count,
+        truncated=executed.truncated,
+        next_page_token=executed.next_page_token,
+        timings=timings,
+        prompt_trimmed=explanation.prompt_trimmed,
+    )
+
+async def answer_in_batch(request: RAGQueryRequest, index: int, documents: "asyncio.Task[List[List[RelevantDocument]]]",
+                          slots: asyncio.Semaphore) -> Dict[str, Any]:
+    """Run one question of a batch once a slot is free; failures become an `error` line."""
+    async def batch_documents() -> List[RelevantDocument]:
+        return (await documents)[index]
+
+    async with slots:
+        graph = add_rag_stages(build_sql_stages(StageGraph(), request), request, batch_documents)
+        try:
+            results, timings = await graph.run(["explain_rag"])
+        except HTTPException as e:
+            return {"index": index, "question": request.question,
+                    "error": {"status_code": e.status_code, "detail": e.detail}}
+        except Exception as e:
+            return {"index": index, "question": request.question,
+                    "error": {"status_code": 500, "detail": str(e)}}
+    return {"index": index, **jsonable_encoder(rag_response(request, results, timings))}
+
+async def stream_rag_batch(request: RAGBatchRequest) -> AsyncIterator[str]:
+    """Answer every question concurrently, emitting one JSON line each in submission order."""
+    slots = asyncio.Semaphore(RAG_BATCH_CONCURRENCY)
+    documents = asyncio.create_task(retrieve_documents_batch(request))
+    answers = [
+        asyncio.create_task(answer_in_batch(
+            RAGQueryRequest(question=question, target_db=request.target_db,
+                            category=request.category, tags=request.tags),
+            index, documents, slots,
+        ))
+        for index, question in enumerate(request.questions)
+    ]
     try:
-        # Use vector search
-        vector_search = VectorRepository.get_instance()
-        results = vector_search.search(request.question, k=3)
-
-        relevant_docs = [
-            RelevantDocument(
-                title=doc["title"],
-                content=doc["content"],
-                category=doc["category"],
-                tags=doc["tags"],
-                relevance_score=doc["relevance_score"]
-            )
-            for doc in results
-        ]
-
-        # Generate combined explanation using both SQL results and relevant docs
-        combined_explanation = explain_rag_results(
-            question=request.question,
-            sql_result=sql_response.result,
-            relevant_docs=relevant_docs
-        )
+        for answer in answers:
+            yield json.dumps(await answer) + "\n"
+    finally:
+        # The client went away or everything was sent; stop whatever is still running
+        for task in (documents, *answers):
+            task.cancel()
 
-        return RAGResponse(
-            question=request.question,
-            sql_query=sql_response.sql_query,
-            sql_result=sql_response.result,
-            relevant_docs=relevant_docs,
-            combined_explanation=combined_explanation
+@app.post("/rag_query/batch")
+async def process_rag_batch(request: RAGBatchRequest):
+    """
+    Answer many questions in one call, streamed as NDJSON in submission order.
+
+    Document retrieval for the whole batch is one encode pass and one vector search.
+    At most RAG_BATCH_CONCURRENCY questions generate, execute and explain SQL at a time.
+    Each line is a RAGResponse with its `index` in the batch, or {index, question, error}
+    for a question that failed.
+    """
+    if len(request.questions) > RAG_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {RAG_BATCH_MAX_QUESTIONS} questions per batch; got {len(request.questions)}"
         )
+    return StreamingResponse(stream_rag_batch(request), media_type="application/x-ndjson")
 
+@app.post("/query/page", response_model=PageResponse)
+async def fetch_query_page(request: PageRequest, http_request: Request):
+    """Fetch the next page of a truncated result using the token from a previous response."""
+    try:
+        page = decode_page_token(request.page_token)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    sql_query = page["sql"]
+    try:
+        async with async_connect(page["db"]) as connection:
+            bounded = await fetch_bounded(connection, sql_query, offset=page["offset"])
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error executing SQL: {str(e)}; Query: {sql_query}")
+
+    response = PageResponse(
+        sql_query=sql_query,
+        result=to_columnar(bounded.columns, bounded.rows),
+        row_count=len(bounded.rows),
+        truncated=bounded.truncated,
+        next_page_token=(
+            encode_page_token(page["db"], sql_query, bounded.next_offset)
+            if bounded.truncated else None
+        ),
+    )
+    return negotiate_result(http_request, response, "result")
+
+# Server-Sent Event names for the stages a streaming client renders.
+STAGE_EVENTS = {
+    "generate_sql": "sql",
+    "execute_sql": "result",
+    "retrieve_documents": "documents",
+}
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def stream_pipeline(graph: StageGraph, targets: List[str],
+                          explanation: Optional[Callable[[Dict[str, Any]], tuple]]) -> AsyncIterator[str]:
+    """
+    Emit each target stage's result as soon as it is ready, then stream explanation tokens.
+
+    `explanation` maps the stage results to a (prompt builder, *args) tuple; the builder
+    returns a BudgetedPrompt, whose trimmed sections are reported in the `done` event.
+    With no `explanation`, `done` follows the stage events directly.
+    """
+    results: Dict[str, Any] = {}
+    try:
+        async for name, result in graph.stream(targets):
+            results[name] = result
+            if name in STAGE_EVENTS:
+                yield sse_event(STAGE_EVENTS[name], result)
+
+        trimmed = []
+        if explanation is not None:
+            explanation_started = time.perf_counter()
+            prompt = await run_llm(*explanation(results))
+            async for token in stream_llm(LLMManager.stream, prompt.text):
+                yield sse_event("token", {"text": token})
+            graph.record("explanation", explanation_started)
+            trimmed = prompt.trimmed
+
+        yield sse_event("done", {"timings": graph.timings, "prompt_trimmed": trimmed})
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error retrieving relevant documents: {str(e)}"
-        ) 
\ No newline at end of file
+        yield sse_event("error", {"status_code": 500, "detail": str(e)})
+
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """Streaming /query: `sql` and `result` events, then explanation `token` events."""
+    graph = build_sql_stages(StageGraph(), request)
+    targets = ["execute_sql"]
+    if request.explain:
+        targets.append("digest_result")
+    return StreamingResponse(
+        stream_pipeline(graph, targets, (lambda results: (
+            budget_explanation_prompt,
+            request.question,
+            results["generate_sql"].llm_output,
+            results["execute_sql"].result,
+            results["digest_result"],
+        )) if request.explain else None),
+        media_type="text/event-stream",
+    )
+
+@app.post("/rag_query/stream")
+async def stream_rag_query(request: RAGQueryRequest):
+    """Streaming /rag_query: `sql`, `result` and `documents` events as each is ready, then explanation tokens."""
+    graph = build_sql_stages(StageGraph(), request)
+    graph.add("retrieve_documents", lambda: retrieve_documents(request))
+    targets = ["execute_sql", "retrieve_documents"]
+    if request.explain:
+        targets.append("digest_result")
+    return StreamingResponse(
+        stream_pipeline(graph, targets, (lambda results: (
+            budget_rag_prompt,
+            request.question,
+            results["execute_sql"].result,
+            results["retrieve_documents"],
+            results["digest_result"],
+        )) if request.explain else None),
+        media_type="text/event-stream",
+    )
+
+@app.get("/metrics")
+def get_metrics():
+    """Expose runtime metrics for the shared connection pools and model pools."""
+    return {
+        "sql_pools": get_pool_metrics(),
+        "llm": LLMManager.get_metrics(),
+        "question_cache": QuestionCache.get_instance().stats(),
+        "result_cache": ResultCache.get_instance().stats(),
+        "query_encoder": VectorRepository.get_instance().embedder.stats(),
+        "query_embedding_cache": VectorRepository.get_instance().query_cache.stats(),
+        "vector_index": VectorRepository.get_instance().index_info(),
+    }
@@ -0,0 +1,119 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+import asyncio
+import time
+
+
+class StageTiming(BaseModel):
+    """When a stage started and finished, relative to the start of the request."""
+    start_ms: float
+    end_ms: float
+    duration_ms: float
+
+
+class StageGraph:
+    """
+    A small dependency graph of async stages.
+
+    Every stage starts as soon as the stages it depends on have finished, so
+    independent stages (e.g. SQL generation and document retrieval) overlap.
+    Each stage function receives its dependencies' results as keyword arguments.
+
+    Evaluation is lazy: given targets, only those stages and what they depend on
+    run, so a graph can declare stages (e.g. an explanation) a caller never pays for.
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self.started: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()) -> "StageGraph":
+        deps = tuple(deps)
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+        self._stages[name] = (fn, deps)
+        return self
+
+    def required(self, targets: Optional[Iterable[str]] = None) -> List[str]:
+        """The targets and every stage they depend on, in the order they were added (all stages by default)."""
+        if targets is None:
+            return list(self._stages)
+        pending = list(targets)
+        unknown = [name for name in pending if name not in self._stages]
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(unknown)}")
+        needed = set()
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self._stages[name][1])
+        return [name for name in self._stages if name in needed]
+
+    async def run(self, targets: Optional[Iterable[str]] = None,
+                  on_complete: Optional[Callable[[str, Any], None]] = None) -> Tuple[Dict[str, Any], Dict[str, StageTiming]]:
+        """Run the target stages (all by default) and what they depend on; return their results and timings."""
+        names = self.required(targets)
+        started = self.started = time.perf_counter()
+        timings = self.timings
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str, fn: Callable[..., Awaitable[Any]], deps: Tuple[str, ...]) -> Any:
+            inputs = {dep: await tasks[dep] for dep in deps}
+            stage_started = time.perf_counter()
+            try:
+                result = await fn(**inputs)
+                if on_complete is not None:
+                    on_complete(name, result)
+                return result
+            finally:
+                stage_finished = time.perf_counter()
+                timings[name] = StageTiming(
+                    start_ms=(stage_started - started) * 1000,
+                    end_ms=(stage_finished - started) * 1000,
+                    duration_ms=(stage_finished - stage_started) * 1000,
+                )
+
+        for name in names:
+            fn, deps = self._stages[name]
+            tasks[name] = asyncio.create_task(run_stage(name, fn, deps))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}, timings
+
+    def record(self, name: str, stage_started: float) -> StageTiming:
+        """Record timing for work done outside the graph (e.g. a streamed explanation)."""
+        stage_finished = time.perf_counter()
+        origin = self.started if self.started is not None else stage_started
+        self.timings[name] = StageTiming(
+            start_ms=(stage_started - origin) * 1000,
+            end_ms=(stage_finished - origin) * 1000,
+            duration_ms=(stage_finished - stage_started) * 1000,
+        )
+        return self.timings[name]
+
+    async def stream(self, targets: Optional[Iterable[str]] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Run like run(targets), yielding (name, result) pairs in the order stages finish."""
+        names = self.required(targets)
+        completed: asyncio.Queue = asyncio.Queue()
+        runner = asyncio.create_task(self.run(names, on_complete=lambda name, result: completed.put_nowait((name, result))))
+        try:
+            for _ in range(len(names)):
+                getter = asyncio.create_task(completed.get())
+                done, _ = await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done and runner.exception() is not None:
+                    getter.cancel()
+                    raise runner.exception()
+                yield await getter
+            await runner
+        finally:
+            if not runner.done():
+                runner.cancel()
@@ -0,0 +1,181 @@
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from pydantic import BaseModel
+import os
+from backend.database.sql.result_format import ColumnarResult
+
+# Share of the prompt's token budget each section is guaranteed. Whatever a section
+# does not need is handed to the sections still short of tokens, in priority order.
+PROMPT_SHARE_QUESTION = float(os.getenv("PROMPT_SHARE_QUESTION", "0.1"))
+PROMPT_SHARE_SQL = float(os.getenv("PROMPT_SHARE_SQL", "0.2"))
+PROMPT_SHARE_ROWS = float(os.getenv("PROMPT_SHARE_ROWS", "0.4"))
+PROMPT_SHARE_DOCUMENTS = float(os.getenv("PROMPT_SHARE_DOCUMENTS", "0.3"))
+# Share of the SQL agent's prompt budget for the schema catalog; the rest is left to the
+# agent's instructions, tool descriptions and its own intermediate steps
+PROMPT_SHARE_SCHEMA = float(os.getenv("PROMPT_SHARE_SCHEMA", "0.5"))
+
+# A document cut shorter than this tells the model too little to be worth including
+MIN_DOCUMENT_TOKENS = 32
+
+TRUNCATION_MARK = " [...]"
+
+TokenCounter = Callable[[str], int]
+
+
+class TrimmedSection(BaseModel):
+    """What was left out of one prompt section to stay within the token budget."""
+    section: str
+    original_tokens: int
+    kept_tokens: int
+    detail: str
+
+
+class BudgetedPrompt(BaseModel):
+    text: str
+    tokens: int
+    trimmed: List[TrimmedSection] = []
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: TokenCounter) -> str:
+    """The longest prefix of text (cut at a word boundary, marked as truncated) within max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + TRUNCATION_MARK) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut + TRUNCATION_MARK if cut else ""
+
+
+class Section:
+    """A named part of a prompt that can shrink to fit a token allowance."""
+
+    def __init__(self, name: str, text: str, share: float):
+        self.name = name
+        self.text = text
+        self.share = share
+
+    def fit(self, max_tokens: int, count_tokens: TokenCounter) -> Tuple[str, str]:
+        """Shrink to max_tokens; returns the text and a description of what was dropped."""
+        return truncate_to_tokens(self.text, max_tokens, count_tokens), "truncated"
+
+
+class RowsSection(Section):
+    """A result table (header line, then one line per row) that shrinks by sampling rows evenly."""
+
+    def fit(self, max_tokens: int, count_tokens: TokenCounter) -> Tuple[str, str]:
+        header, *rows = self.text.split("\n")
+        if not rows or count_tokens(header) > max_tokens:
+            return truncate_to_tokens(self.text, max_tokens, count_tokens), "truncated"
+
+        def render(n: int) -> str:
+            sample = sample_evenly(rows, n)
+            return "\n".join([header, *sample, f"({n} of {len(rows)} rows shown, evenly sampled)"])
+
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(render(middle)) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return render(low), f"kept {low} of {len(rows)} rows, evenly sampled"
+
+
+def result_section(name: str, result: ColumnarResult, share: float, digest: Optional[str] = None) -> Section:
+    """The result's digest when it has one (see result_digest.needs_digest), otherwise its rows."""
+    if digest is not None:
+        return Section(name, digest, share)
+    return RowsSection(name, result.to_text(), share)
+
+
+def sample_evenly(items: Sequence[Any], n: int) -> List[Any]:
+    """n items spread evenly over the sequence, always including the first and last."""
+    if n >= len(items):
+        return list(items)
+    if n <= 1:
+        return list(items[:n])
+    return [items[i * (len(items) - 1) // (n - 1)] for i in range(n)]
+
+
+class DocumentsSection(Section):
+    """Retrieved documents, most relevant first; shrinks by truncating one document and dropping the rest."""
+
+    SEPARATOR = "\n\n"
+
+    def __init__(self, name: str, documents: Sequence[Any], share: float):
+        self.documents = list(documents)
+        super().__init__(name, self.SEPARATOR.join(self.render(doc, doc.content) for doc in self.documents), share)
+
+    @staticmethod
+    def render(doc: Any, content: str) -> str:
+        return f"Document: {doc.title}\n{content}\nTags: {', '.join(doc.tags)}"
+
+    def fit(self, max_tokens: int, count_tokens: TokenCounter) -> Tuple[str, str]:
+        parts: List[str] = []
+        truncated = False
+        for doc in self.documents:
+            whole = self.render(doc, doc.content)
+            if count_tokens(self.SEPARATOR.join([*parts, whole])) <= max_tokens:
+                parts.append(whole)
+                continue
+            # Give what is left to a shortened copy of this document, then stop
+            used = count_tokens(self.SEPARATOR.join([*parts, self.render(doc, "")]))
+            if max_tokens - used >= MIN_DOCUMENT_TOKENS:
+                parts.append(self.render(doc, truncate_to_tokens(doc.content, max_tokens - used, count_tokens)))
+                truncated = True
+            break
+        detail = f"kept {len(parts)} of {len(self.documents)} documents"
+        if truncated:
+            detail += ", the last one truncated"
+        return self.SEPARATOR.join(parts), detail
+
+
+def build_prompt(template: str, sections: List[Section], max_tokens: int,
+                 count_tokens: TokenCounter) -> BudgetedPrompt:
+    """
+    Fill template's {name} placeholders with the sections, shrinking them to fit max_tokens.
+
+    Args:
+        template: prompt text with one str.format placeholder per section
+        sections: the sections in priority order; spare tokens go to earlier ones first
+        max_tokens: token budget for the whole prompt, template included
+        count_tokens: the active model's tokenizer, e.g. llm.get_num_tokens
+
+    Returns:
+        BudgetedPrompt: the prompt, its token count and what was trimmed from each section
+    """
+    overhead = count_tokens(template.format(**{section.name: "" for section in sections}))
+    budget = max(max_tokens - overhead, 0)
+
+    needs = [count_tokens(section.text) for section in sections]
+    allowances = [min(need, int(section.share * budget)) for section, need in zip(sections, needs)]
+    spare = budget - sum(allowances)
+    for i, need in enumerate(needs):
+        extra = min(need - allowances[i], spare)
+        allowances[i] += extra
+        spare -= extra
+
+    filled = {}
+    trimmed = []
+    for section, need, allowance in zip(sections, needs, allowances):
+        if need <= allowance:
+            filled[section.name] = section.text
+            continue
+        text, detail = section.fit(allowance, count_tokens)
+        filled[section.name] = text
+        trimmed.append(TrimmedSection(
+            section=section.name,
+            original_tokens=need,
+            kept_tokens=count_tokens(text) if text else 0,
+            detail=detail,
+        ))
+
+    text = template.format(**filled)
+    return BudgetedPrompt(text=text, tokens=count_tokens(text), trimmed=trimmed)
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+import threading
+import re
+import time
+import os
+from backend.database.nosql.repository.vector_repository import VectorRepository
+from backend.database.nosql.vector_search import QUERY_EMBEDDING_CACHE_SHARED, normalize_query
+
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "512"))
+QUESTION_CACHE_TTL = float(os.getenv("QUESTION_CACHE_TTL", "86400"))
+QUESTION_CACHE_THRESHOLD = float(os.getenv("QUESTION_CACHE_THRESHOLD", "0.95"))
+
+
+_MONTHS_AND_DAYS = (
+    "january|february|march|april|may|june|july|august|september|october|november|december|"
+    "jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec|"
+    "monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+)
+_LITERAL = re.compile(
+    r"""(?<!\w)'([^']+)'(?!\w)|"([^"]+)"|"""    # quoted strings, not apostrophes
+    r"(\d+(?:[.:/-]\d+)*)|"                     # numbers, dates and times
+    rf"\b({_MONTHS_AND_DAYS})\b|"               # month and day names
+    r"\b([A-Z][\w-]*)",                         # capitalised names
+    re.IGNORECASE,
+)
+
+
+def extract_literals(question: str) -> Tuple[str, ...]:
+    """
+    The values a question filters on, in order: quoted strings, numbers and dates, month and
+    day names, and capitalised names. Questions that differ only in these ("battery 12" vs
+    "battery 21", "in October" vs "in November") embed almost identically but need different SQL.
+    """
+    literals = []
+    for match in _LITERAL.finditer(question):
+        name = match.group(5)
+        if name is not None:
+            # IGNORECASE lets any word through this branch, and a sentence's first word is capitalised anyway
+            starts_sentence = question[:match.start()].rstrip()[-1:] in ("", ".", "?", "!")
+            if not name[0].isupper() or starts_sentence:
+                continue
+        value = next(group for group in match.groups() if group is not None)
+        literals.append(value.lower())
+    return tuple(literals)
+
+
+class CachedSQL:
+    """A validated question-to-SQL translation."""
+
+    def __init__(self, question: str, embedding: np.ndarray, literals: Tuple[str, ...], sql_query: str,
+                 llm_output: str, schema_version: str, llm_seconds: float):
+        self.question = question
+        self.embedding = embedding
+        self.literals = literals
+        self.sql_query = sql_query
+        self.llm_output = llm_output
+        self.schema_version = schema_version
+        self.llm_seconds = llm_seconds
+        self.created_at = time.monotonic()
+
+
+class CacheLookup:
+    """Outcome of a lookup; carries the question embedding so a miss can be stored without re-encoding."""
+
+    def __init__(self, key: Tuple[str, str], embedding: np.ndarray, literals: Tuple[str, ...], schema_version: str,
+                 entry: Optional[CachedSQL] = None, similarity: float = 0.0):
+        self.key = key
+        self.embedding = embedding
+        self.literals = literals
+        self.schema_version = schema_version
+        self.entry = entry
+        self.similarity = similarity
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+
+class QuestionCache:
+    """
+    Semantic cache in front of the SQL agent, keyed by question embeddings.
+
+    Similarity alone only admits candidates: a similar question is a hit when it also
+    has the same literals (see extract_literals), since those decide the SQL.
+    """
+    _instance: Optional["QuestionCache"] = None
+
+    def __init__(self, max_size: int = QUESTION_CACHE_SIZE, ttl: float = QUESTION_CACHE_TTL,
+                 threshold: float = QUESTION_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[str, str], CachedSQL]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.saved_llm_seconds = 0.0
+
+    @classmethod
+    def get_instance(cls) -> "QuestionCache":
+        if cls._instance is None:
+            cls._instance = QuestionCache()
+        return cls._instance
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector_search = VectorRepository.get_instance()
+        if QUERY_EMBEDDING_CACHE_SHARED:
+            # A /rag_query question is then encoded once for both the cache and the retriever
+            embedding = vector_search.encode_query(question)
+        else:
+            embedding = vector_search.embedder.encode([question])[0]
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def _purge(self, target_db: str, schema_version: str) -> None:
+        """Drop expired entries and entries built against an older schema."""
+        now = time.monotonic()
+        stale = [
+            key for key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl
+            or (key[0] == target_db and entry.schema_version != schema_version)
+        ]
+        for key in stale:
+            del self._entries[key]
+
+    def lookup(self, question: str, target_db: str, schema_version: str) -> CacheLookup:
+        """Find a cached translation whose question is similar enough to this one and has the same literals."""
+        normalized = normalize_query(question)
+        key = (target_db, normalized)
+        embedding = self._embed(normalized)
+        literals = extract_literals(question)
+
+        with self._lock:
+            self.lookups += 1
+            self._purge(target_db, schema_version)
+
+            entry = self._entries.get(key)
+            similarity = 1.0 if entry is not None else 0.0
+            if entry is None:
+                candidates = [
+                    (k, e) for k, e in self._entries.items() if k[0] == target_db and e.literals == literals
+                ]
+                if candidates:
+                    matrix = np.stack([e.embedding for _, e in candidates])
+                    scores = matrix @ embedding
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        key, entry = candidates[best]
+                        similarity = float(scores[best])
+
+            if entry is None:
+                return CacheLookup((target_db, normalized), embedding, literals, schema_version)
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_llm_seconds += entry.llm_seconds
+            return CacheLookup(key, embedding, literals, schema_version, entry, similarity)
+
+    def store(self, lookup: CacheLookup, sql_query: str, llm_output: str, llm_seconds: float) -> None:
+        """Remember a translation whose SQL executed successfully."""
+        with self._lock:
+            self._entries[lookup.key] = CachedSQL(
+                question=lookup.key[1],
+                embedding=lookup.embedding,
+                literals=lookup.literals,
+                sql_query=sql_query,
+                llm_output=llm_output,
+                schema_version=lookup.schema_version,
+                llm_seconds=llm_seconds,
+            )
+            self._entries.move_to_end(lookup.key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hit_rate,
+                "saved_llm_seconds": round(self.saved_llm_seconds, 3),
+            }
@@ -1,36 +1,58 @@
-from typing import List
+from typing import List, Optional, Tuple
 from backend.database.nosql.model.battery_knowledge import BatteryKnowledge
-from backend.sql_agent import get_llm
+from backend.database.sql.result_format import ColumnarResult
+from backend.llm_manager import LLMManager
+from backend.prompt_budget import (
+    PROMPT_SHARE_QUESTION, PROMPT_SHARE_ROWS, PROMPT_SHARE_DOCUMENTS,
+    BudgetedPrompt, TrimmedSection, TokenCounter, Section, DocumentsSection, build_prompt, result_section,
+)
 
-def explain_rag_results(question: str, sql_result: str, relevant_docs: List[BatteryKnowledge]) -> str:
-    """
-    Generate a comprehensive explanation combining SQL results and relevant documents.
-    """
-    # Create context from relevant documents
-    docs_context = "\n\n".join([
-        f"Document: {doc.title}\n{doc.content}\nTags: {', '.join(doc.tags)}"
-        for doc in relevant_docs
-    ])
-    
-    prompt = f"""
+RAG_TEMPLATE = """
     Question: {question}
-    
+
     SQL Query Results:
-    {sql_result}
-    
+    {rows}
+
     Related Knowledge:
-    {docs_context}
-    
+    {documents}
+
     Please provide a comprehensive explanation that:
     1. Explains the SQL query results
     2. Incorporates relevant information from the knowledge base
     3. Provides additional context and insights by combining both sources
     4. Highlights any important patterns or relationships between the data
-    
+
     Format your response in markdown.
     """
-    
-    llm = get_llm()
-    explanation = llm.predict(prompt)
-    
-    return explanation 
\ No newline at end of file
+
+def build_rag_prompt(question: str, sql_result: ColumnarResult, relevant_docs: List[BatteryKnowledge],
+                     count_tokens: TokenCounter, max_tokens: int, digest: Optional[str] = None) -> BudgetedPrompt:
+    """
+    Build the prompt combining SQL results (or their digest) and relevant documents, within max_tokens.
+    Rows take priority over documents; the least relevant documents are dropped first.
+    """
+    return build_prompt(RAG_TEMPLATE, [
+        Section("question", question, PROMPT_SHARE_QUESTION),
+        result_section("rows", sql_result, PROMPT_SHARE_ROWS, digest),
+        DocumentsSection("documents", relevant_docs, PROMPT_SHARE_DOCUMENTS),
+    ], max_tokens, count_tokens)
+
+def budget_rag_prompt(question: str, sql_result: ColumnarResult, relevant_docs: List[BatteryKnowledge],
+                      digest: Optional[str] = None) -> BudgetedPrompt:
+    """build_rag_prompt, sized with the active model's tokenizer and context window."""
+    with LLMManager.acquire() as llm:
+        return build_rag_prompt(question, sql_result, relevant_docs, llm.get_num_tokens,
+                                LLMManager.prompt_token_limit(), digest)
+
+def explain_rag_results(question: str, sql_result: ColumnarResult, relevant_docs: List[BatteryKnowledge],
+                        digest: Optional[str] = None) -> Tuple[str, List[TrimmedSection]]:
+    """
+    Generate a comprehensive explanation combining SQL results and relevant documents.
+    Also returns what was cut from the prompt to fit the model.
+    """
+    with LLMManager.acquire() as llm:
+        prompt = build_rag_prompt(question, sql_result, relevant_docs, llm.get_num_tokens,
+                                  LLMManager.prompt_token_limit(), digest)
+        explanation = llm.predict(prompt.text)
+
+    return explanation, prompt.trimmed
@@ -1,39 +1,54 @@
-from typing import Any, List, Optional
-import os
+from typing import Dict, List, Optional, Tuple
+import threading
 from backend.database.sql.database import get_engine
+from backend.database.sql.result_format import ColumnarResult
+from backend.database.sql.schema_catalog import SchemaCatalogRegistry
 from langchain.agents import create_sql_agent
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langchain_community.utilities.sql_database import SQLDatabase
-from langchain.llms import LlamaCpp
-from langchain_openai import ChatOpenAI
+from backend.llm_manager import LLMManager
+from backend.prompt_budget import (
+    PROMPT_SHARE_QUESTION, PROMPT_SHARE_SQL, PROMPT_SHARE_ROWS, PROMPT_SHARE_SCHEMA,
+    BudgetedPrompt, TrimmedSection, TokenCounter, Section, build_prompt, result_section,
+)
 
-def get_llm():
-    """Initialize and return the configured LLM."""
-    llm_provider = os.getenv("LLM_PROVIDER", "local").lower()
-    
-    if llm_provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required when using OpenAI")
-        
-        return ChatOpenAI(
-            api_key=api_key,
-            temperature=0.1,
-            model="gpt-4o-mini"
-        )
-    
-    elif llm_provider == "local":
-        return LlamaCpp(
-            model_path="./models/llama-2-7b-chat.gguf",
-            temperature=0.1,
-            max_tokens=1024,
-            top_p=0.9,
-            n_ctx=2048,
-            n_gpu_layers=1
-        )
-    
-    else:
-        raise ValueError(f"Unsupported LLM provider: {llm_provider}")
+# SQLDatabase wrappers keyed by (database name, schema version) so the
+# toolkit does not re-reflect the schema on every request.
+_sql_databases: Dict[Tuple[str, str], SQLDatabase] = {}
+# The agent runs in the LLM executor's threads, so several requests can get here at once
+_sql_databases_lock = threading.Lock()
+
+# The catalog in the prompt replaces sql_db_list_tables and sql_db_schema, so the
+# agent only gets the tools to check and run a query.
+AGENT_TOOL_NAMES = {"sql_db_query", "sql_db_query_checker"}
+
+AGENT_SUFFIX = """Begin!
+
+Question: {input}
+Thought: The question includes the complete database schema, so I can write the query directly.
+{agent_scratchpad}"""
+
+class QueryOnlySQLToolkit(SQLDatabaseToolkit):
+    """SQLDatabaseToolkit without the schema-discovery tools."""
+
+    def get_tools(self):
+        return [tool for tool in super().get_tools() if tool.name in AGENT_TOOL_NAMES]
+
+def get_sql_database(target_db: str, schema_version: str) -> SQLDatabase:
+    """Return the cached SQLDatabase for a database, rebuilding it when the schema changes."""
+    key = (target_db, schema_version)
+    db = _sql_databases.get(key)
+    if db is not None:
+        return db
+
+    with _sql_databases_lock:
+        db = _sql_databases.get(key)
+        if db is None:
+            for stale_key in [k for k in _sql_databases if k[0] == target_db]:
+                del _sql_databases[stale_key]
+            db = SQLDatabase(engine=get_engine(target_db))
+            _sql_databases[key] = db
+        return db
 
 def format_sql_query(query: str) -> str:
     """Format a SQL query with our custom markers."""
@@ -58,59 +73,67 @@ def is_valid_sql(query: str) -> bool:
     # Check if it starts with a SQL keyword
     return any(cleaned_query.startswith(keyword) for keyword in sql_starters)
 
-def generate_sql_from_question(question: str, db_url: str) -> tuple[str, str]:
+def generate_sql_from_question(question: str, db_url: str, target_db: str = "default") -> tuple[str, str]:
     """
     Generate SQL query from a natural language question using LLM.
     
     Args:
         question (str): The natural language question
         db_url (str): Database connection URL
+        target_db (str): Name of the configured database to query
     
     Returns:
         tuple[str, str]: A tuple containing (extracted_sql_query, full_llm_output)
     """
-    # Initialize the LLM
-    llm = get_llm()
-    engine = get_engine()
-    
-    # Create SQLDatabase instance from the engine
-    db = SQLDatabase(engine=engine)
-    
-    # Create the SQL toolkit
-    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-
-    # Create the SQL agent
-    agent_executor = create_sql_agent(
-        llm=llm,
-        toolkit=toolkit,
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=10,  # Allow multiple attempts
-    )
-
-    # Add context to the question
-    enhanced_question = f"""
-    Using the database schema provided, please help me answer this question:
-    {question}
-    
-    Please make sure to:
-    1. Examine the available tables and their relationships
-    2. Generate a valid SQL query that answers the question
-    3. Return ONLY the SQL query starting with SELECT, INSERT, UPDATE, or DELETE
-    4. Do not include any explanations, comments, or natural language responses
-    5. Do not directly return the query results, only the query itself
-    
-    Example of a good response:
-    SELECT column FROM table WHERE condition;
-    
-    Example of a bad response:
-    The query results show that...
-    Here's what I found...
-    """
+    # The precomputed catalog replaces the agent's list-tables/schema discovery tools
+    catalog = SchemaCatalogRegistry.get(target_db)
+    db = get_sql_database(target_db, catalog.version)
 
-    # Execute the agent with the enhanced question
+    # Execute the agent with the enhanced question, holding a pooled LLM for the whole run
     try:
-        result = agent_executor.run(enhanced_question)
+        with LLMManager.acquire() as llm:
+            # Bound the catalog so large schemas still leave room for the agent's own steps
+            schema = catalog.to_prompt(
+                int(PROMPT_SHARE_SCHEMA * LLMManager.prompt_token_limit()), llm.get_num_tokens
+            )
+
+            # Add context to the question
+            enhanced_question = f"""
+            Using the database schema provided, please help me answer this question:
+            {question}
+
+            Database schema (up to date; sample rows and column stats may be left out for space):
+            {schema}
+    
+            Please make sure to:
+            1. Use the tables and relationships described in the schema above
+            2. Generate a valid SQL query that answers the question
+            3. Return ONLY the SQL query starting with SELECT, INSERT, UPDATE, or DELETE
+            4. Do not include any explanations, comments, or natural language responses
+            5. Do not directly return the query results, only the query itself
+    
+            Example of a good response:
+            SELECT column FROM table WHERE condition;
+    
+            Example of a bad response:
+            The query results show that...
+            Here's what I found...
+            """
+
+            # Create the SQL toolkit, limited to checking and running queries
+            toolkit = QueryOnlySQLToolkit(db=db, llm=llm)
+
+            # Create the SQL agent
+            agent_executor = create_sql_agent(
+                llm=llm,
+                toolkit=toolkit,
+                suffix=AGENT_SUFFIX,
+                verbose=True,
+                handle_parsing_errors=True,
+                max_iterations=10,  # Allow multiple attempts
+            )
+
+            result = agent_executor.run(enhanced_question)
         print(f"agent_result: {result}")
         if "I don't know" in result or not result.strip() or not is_valid_sql(result):
             raise ValueError("The LLM was unable to generate a valid SQL query. Please provide more context or rephrase the question.")
@@ -134,25 +157,10 @@ def generate_sql_from_question(question: str, db_url: str) -> tuple[str, str]:
             raise
         raise
 
-def explain_query_execution(question: str, sql_query: str, result: str) -> str:
-    """
-    Generate a natural language explanation of the SQL query execution using ChatLlamaAPI.
-    
-    Args:
-        question (str): Original natural language question
-        sql_query (str): Generated SQL query
-        result (str): Query execution result
-    
-    Returns:
-        str: Natural language explanation
-    """
-    llm = get_llm()
-    
-    # Create a prompt that asks for an explanation
-    prompt = f"""Given the following:
+EXPLANATION_TEMPLATE = """Given the following:
     Question: {question}
-    SQL Query: {sql_query}
-    Result: {result}
+    SQL Query: {sql}
+    Result: {rows}
     
     Please provide a clear, concise explanation of:
     1. How the SQL query addresses the question
@@ -160,8 +168,44 @@ def explain_query_execution(question: str, sql_query: str, result: str) -> str:
     3. Any important insights from the data
     
     Explanation:"""
+
+def build_explanation_prompt(question: str, sql_query: str, result: ColumnarResult, count_tokens: TokenCounter,
+                             max_tokens: int, digest: Optional[str] = None) -> BudgetedPrompt:
+    """
+    Create a prompt that asks for an explanation of a query and its result, within max_tokens.
+    A digest of the result, when given, stands in for its rows.
+    """
+    return build_prompt(EXPLANATION_TEMPLATE, [
+        Section("question", question, PROMPT_SHARE_QUESTION),
+        Section("sql", sql_query, PROMPT_SHARE_SQL),
+        result_section("rows", result, PROMPT_SHARE_ROWS, digest),
+    ], max_tokens, count_tokens)
+
+def budget_explanation_prompt(question: str, sql_query: str, result: ColumnarResult,
+                              digest: Optional[str] = None) -> BudgetedPrompt:
+    """build_explanation_prompt, sized with the active model's tokenizer and context window."""
+    with LLMManager.acquire() as llm:
+        return build_explanation_prompt(question, sql_query, result, llm.get_num_tokens,
+                                        LLMManager.prompt_token_limit(), digest)
+
+def explain_query_execution(question: str, sql_query: str, result: ColumnarResult,
+                            digest: Optional[str] = None) -> Tuple[str, List[TrimmedSection]]:
+    """
+    Generate a natural language explanation of the SQL query execution using ChatLlamaAPI.
     
+    Args:
+        question (str): Original natural language question
+        sql_query (str): Generated SQL query
+        result (ColumnarResult): Query execution result
+        digest (Optional[str]): Summary of a large or truncated result, used instead of its rows
+    
+    Returns:
+        Tuple[str, List[TrimmedSection]]: The explanation, and what was cut from the prompt to fit the model
+    """
     # Get the explanation from the LLM
-    response = llm.predict(prompt)
+    with LLMManager.acquire() as llm:
+        prompt = build_explanation_prompt(question, sql_query, result, llm.get_num_tokens,
+                                          LLMManager.prompt_token_limit(), digest)
+        response = llm.predict(prompt.text)
     
-    return response
\ No newline at end of file
+    return response, prompt.trimmed
@@ -4,7 +4,7 @@ import pandas as pd
 import json
 from datetime import datetime
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Tuple
 
 # Get backend URL from environment variable or use default
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:8000')
@@ -67,67 +67,93 @@ with st.sidebar:
         st.session_state.sql_question = random_query
         st.session_state.rag_question = random_query
 
-def query_backend(endpoint: str, question: str) -> Dict[Any, Any]:
-    """Send a query to the backend API."""
-    url = f"{BACKEND_URL}/{endpoint}"
+def stream_backend(endpoint: str, question: str) -> Iterator[Tuple[str, Any]]:
+    """Send a query to a streaming backend endpoint and yield its Server-Sent Events."""
+    url = f"{BACKEND_URL}/{endpoint}/stream"
     try:
-        response = requests.post(
+        with requests.post(
             url,
             json={"question": question, "target_db": target_db},
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()
+            stream=True,
+            timeout=(10, 300)  # (connect, max wait between events)
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event:
+                    yield event, json.loads(line[len("data: "):])
     except requests.exceptions.RequestException as e:
         st.error(f"Error communicating with backend: {str(e)}")
-        return None
-
-def display_sql_results(data: Dict[Any, Any]):
-    """Display SQL query results."""
-    if data and "sql_query" in data:
-        st.markdown("### 🔍 SQL Query")
-        st.code(data["sql_query"], language="sql")
-        
-        st.markdown("### 📊 Query Result")
-        try:
-            result_data = eval(data.get("result"))
-            if isinstance(result_data, (list, tuple)):
-                df = pd.DataFrame(result_data)
-                st.dataframe(df, use_container_width=True)
-            else:
-                st.write(data.get("result"))
-        except:
-            st.write(data.get("result"))
-
-def display_rag_results(data: Dict[Any, Any]):
-    """Display RAG results including relevant documents."""
-    if not data:
-        return
 
-    # Display SQL Query and Results
+def display_sql_query(sql_query: str):
+    """Display the generated SQL query."""
     st.markdown("### 🔍 SQL Query")
-    st.code(data["sql_query"], language="sql")
-    
-    st.markdown("### 📊 SQL Query Result")
-    try:
-        result_data = eval(data.get("sql_result"))
-        if isinstance(result_data, (list, tuple)):
-            df = pd.DataFrame(result_data)
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.write(data.get("sql_result"))
-    except:
-        st.write(data.get("sql_result"))
-
-    # Display Relevant Documents
+    st.code(sql_query, language="sql")
+
+def columnar_to_dataframe(result: Dict[str, Any]) -> pd.DataFrame:
+    """Build a DataFrame from the backend's column-oriented result payload."""
+    columns = result.get("columns", [])
+    series = []
+    for column, values in zip(columns, result.get("values", [])):
+        values = pd.Series(values)
+        if column["type"] in ("date", "timestamp"):
+            values = pd.to_datetime(values)
+        series.append(values)
+    if not series:
+        return pd.DataFrame()
+    df = pd.concat(series, axis=1)
+    df.columns = [column["name"] for column in columns]
+    return df
+
+def display_result_table(title: str, result: Dict[str, Any], truncated: bool = False, row_count: int = 0):
+    """Display SQL query results as a table."""
+    st.markdown(f"### 📊 {title}")
+    if truncated:
+        st.caption(f"Showing the first {row_count} rows; the full result was truncated.")
+    st.dataframe(columnar_to_dataframe(result), use_container_width=True)
+
+def display_relevant_docs(docs: List[Dict[str, Any]]):
+    """Display relevant documents retrieved from the knowledge base."""
     st.markdown("### 📚 Relevant Knowledge")
-    for i, doc in enumerate(data.get("relevant_docs", []), 1):
+    for i, doc in enumerate(docs, 1):
         with st.expander(f"📄 {doc['title']} (Relevance: {doc['relevance_score']:.2f})"):
             st.markdown(f"**Category:** {doc['category']}")
             st.markdown(f"**Tags:** {', '.join(doc['tags'])}")
             st.markdown("**Content:**")
             st.markdown(doc['content'])
 
+def display_streamed_response(endpoint: str, question: str, result_title: str, explanation_title: str):
+    """Render each part of the response as soon as the backend sends it."""
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        sql_slot = st.empty()
+        result_slot = st.empty()
+        docs_slot = st.empty()
+    with col2:
+        st.markdown(f"### 📝 {explanation_title}")
+        explanation_slot = st.empty()
+        explanation_slot.markdown("_Waiting for results..._")
+
+    explanation = ""
+    for event, data in stream_backend(endpoint, question):
+        if event == "sql":
+            with sql_slot.container():
+                display_sql_query(data["sql_query"])
+        elif event == "result":
+            with result_slot.container():
+                display_result_table(result_title, data["result"], data.get("truncated", False), data.get("row_count", 0))
+        elif event == "documents":
+            with docs_slot.container():
+                display_relevant_docs(data)
+        elif event == "token":
+            explanation += data["text"]
+            explanation_slot.markdown(explanation + "▌")
+        elif event == "error":
+            st.error(f"Error from backend: {data['detail']}")
+    explanation_slot.markdown(explanation)
+
 def main():
     # Header
     st.title("🤖 Smart Battery Storage Knowledge RAG Service")
@@ -147,17 +173,7 @@ def main():
 
         if st.button("Generate SQL Query", key="sql_button"):
             if question_sql:
-                with st.spinner("Generating SQL query and explanation..."):
-                    data = query_backend("query", question_sql)
-                    if data:
-                        col1, col2 = st.columns([3, 2])
-                        
-                        with col1:
-                            display_sql_results(data)
-                        
-                        with col2:
-                            st.markdown("### 📝 Explanation")
-                            st.markdown(data.get("explanation", ""))
+                display_streamed_response("query", question_sql, "Query Result", "Explanation")
             else:
                 st.warning("Please enter a question first.")
 
@@ -172,17 +188,7 @@ def main():
 
         if st.button("Generate Enhanced Response", key="rag_button"):
             if question_rag:
-                with st.spinner("Generating comprehensive response..."):
-                    data = query_backend("rag_query", question_rag)
-                    if data:
-                        col1, col2 = st.columns([3, 2])
-                        
-                        with col1:
-                            display_rag_results(data)
-                        
-                        with col2:
-                            st.markdown("### 📝 Combined Analysis")
-                            st.markdown(data.get("combined_explanation", ""))
+                display_streamed_response("rag_query", question_rag, "SQL Query Result", "Combined Analysis")
             else:
                 st.warning("Please enter a question first.")
 